@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Response, Request
+from fastapi import APIRouter, Depends, HTTPException, status, Response, Request, WebSocket
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
 from sqlalchemy.orm import Session
 from app.db.database import get_db
@@ -38,6 +38,14 @@ def get_current_user(request: Request, db: Session = Depends(get_db)):
         )
     return user
 
+
+def get_websocket_user(websocket: WebSocket, db: Session):
+    """То же, что get_current_user, для WebSocket: None вместо 401."""
+    username = websocket.session.get("user")
+    if username is None:
+        return None
+    return get_user_by_username(db, username)
+
 @router.post("/sign-up")
 def register_user(user: UserCreate, db: Session = Depends(get_db)):
     # Проверка существования пользователя
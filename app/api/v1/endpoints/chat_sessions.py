@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Request
 from sqlalchemy.orm import Session
 from app.db.database import get_db
 from app.models.user_model import User
@@ -6,7 +6,10 @@ from app.services.chat_service import (
     create_chat_session, get_chat_sessions, get_chat_session, add_transcription_to_chat, get_chat_history
 )
 from app.api.auth.auth import get_current_user
-from app.api.v1.endpoints.transcriptions import transcribe_audio_file
+from app.api.v1.endpoints.transcriptions import (
+    transcribe_audio_file, enqueue_transcription_job, stream_transcription_progress
+)
+from app.core.executors import run_io
 from typing import List, Optional
 from pydantic import BaseModel
 from datetime import datetime
@@ -91,25 +94,41 @@ def get_session_history(
 @router.post("/sessions/{session_id}/transcribe")
 async def transcribe_in_session(
         session_id: int,
+        request: Request,
         file: UploadFile = File(...),
         language: str = Form("kk"),
         task: str = Form("transcribe"),
         enable_diarization: bool = Form(True),  # Добавляем параметр
+        async_mode: bool = Form(False),  # 202 + job_id вместо ожидания результата
+        progress: bool = Form(False),  # text/event-stream с сегментами по мере готовности
         db: Session = Depends(get_db),
         current_user: User = Depends(get_current_user)
 ):
     # Проверяем, существует ли сессия
-    session = get_chat_session(db, session_id, current_user.id)
+    session = await run_io(get_chat_session, db, session_id, current_user.id)
     if not session:
         raise HTTPException(status_code=404, detail="Чат-сессия не найдена")
 
+    # Асинхронно: сообщение в чат добавит задача после завершения
+    if async_mode:
+        return await enqueue_transcription_job(
+            file, language, task, enable_diarization, db, current_user, chat_session_id=session_id
+        )
+
+    # Поток прогресса: сообщение в чат добавится после сохранения
+    if progress:
+        return await stream_transcription_progress(
+            file, language, task, enable_diarization, current_user, request, chat_session_id=session_id
+        )
+
     # Транскрибируем аудио с параметром диаризации
     transcription_result = await transcribe_audio_file(
         file, language, task, enable_diarization, db, current_user
     )
 
     # Добавляем результат в чат
-    add_transcription_to_chat(
+    await run_io(
+        add_transcription_to_chat,
         db,
         session_id,
         transcription_result.id,
@@ -118,6 +137,6 @@ async def transcribe_in_session(
 
     # Обновляем время последней активности сессии
     session.updated_at = datetime.now()
-    db.commit()
+    await run_io(db.commit)
 
     return transcription_result
\ No newline at end of file
@@ -0,0 +1,63 @@
+from datetime import datetime
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel
+from sqlalchemy.orm import Session
+
+from app.api.auth.auth import get_current_user
+from app.api.v1.endpoints.transcriptions import TranscriptionResponse, transcription_response
+from app.db.database import get_db
+from app.models.user_model import User
+from app.services.job_service import get_job
+
+router = APIRouter(
+    prefix="/api/v1",
+    tags=["jobs"]
+)
+
+
+class JobStatusResponse(BaseModel):
+    id: str
+    status: str
+    error: Optional[str] = None
+    transcription_id: Optional[int] = None
+    chat_session_id: Optional[int] = None
+    created_at: datetime
+    updated_at: datetime
+
+
+@router.get("/jobs/{job_id}", response_model=JobStatusResponse)
+def get_job_status(
+        job_id: str,
+        db: Session = Depends(get_db),
+        current_user: User = Depends(get_current_user)
+):
+    job = get_job(db, job_id, current_user.id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Задача не найдена")
+
+    return JobStatusResponse(
+        id=job.id,
+        status=job.status,
+        error=job.error,
+        transcription_id=job.audio_transcription_id,
+        chat_session_id=job.chat_session_id,
+        created_at=job.created_at,
+        updated_at=job.updated_at
+    )
+
+
+@router.get("/jobs/{job_id}/result", response_model=TranscriptionResponse)
+def get_job_result(
+        job_id: str,
+        db: Session = Depends(get_db),
+        current_user: User = Depends(get_current_user)
+):
+    job = get_job(db, job_id, current_user.id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Задача не найдена")
+    if job.status != "done":
+        raise HTTPException(status_code=409, detail=f"Задача не завершена: {job.status}")
+
+    return transcription_response(job.audio_transcription)
@@ -0,0 +1,20 @@
+from fastapi import APIRouter, Depends
+
+from app.api.auth.auth import get_current_user
+from app.core.executors import run_io
+from app.services.admission_service import admission
+from app.services.inference import whisper_batching_stats
+
+router = APIRouter(
+    prefix="/api/v1",
+    tags=["metrics"]
+)
+
+
+@router.get("/metrics")
+async def get_metrics(current_user = Depends(get_current_user)):
+    """Состояние очереди допуска и динамического батчинга Whisper для настройки."""
+    return {
+        "admission": admission.stats(),
+        "whisper_batching": await run_io(whisper_batching_stats),
+    }
@@ -0,0 +1,103 @@
+# app/api/v1/endpoints/streaming.py
+
+import logging
+from contextlib import AsyncExitStack
+from datetime import datetime
+
+from fastapi import APIRouter, Depends, HTTPException, WebSocket, WebSocketDisconnect
+from sqlalchemy.orm import Session
+
+from app.services.storage_service import storage_service
+from app.services.streaming_service import PcmDecoder, StreamingTranscriber
+from app.services.admission_service import admission
+from app.services.transcription_service import stream_result, polish_result, save_transcription
+from app.core.executors import run_cpu, run_io
+from app.db.database import get_db
+from app.api.auth.auth import get_websocket_user
+from app.api.v1.endpoints.transcriptions import transcription_response
+
+router = APIRouter(
+    prefix="/api/v1",
+    tags=["transcriptions"]
+)
+
+logger = logging.getLogger(__name__)
+
+
+@router.websocket("/transcribe/stream")
+async def transcribe_stream(
+    websocket: WebSocket,
+    language: str = "kk",
+    task: str = "transcribe",
+    format: str = "pcm_s16le",
+    sample_rate: int = 16000,
+    db: Session = Depends(get_db)
+):
+    """
+    Потоковая транскрипция. Клиент шлёт бинарные сообщения с аудио
+    (pcm_s16le, pcm_f32le или Opus-пакеты, моно, sample_rate Гц) и текст "stop"
+    в конце. Сервер отвечает JSON-событиями:
+      {"type": "partial", "start", "end", "text"} — гипотеза по незафиксированному хвосту;
+      {"type": "final", "start", "end", "text"} — зафиксированный сегмент;
+      {"type": "done", ...TranscriptionResponse} — запись сохранена как обычная транскрипция;
+      {"type": "error", "detail"} — перед закрытием: неверный формат, битый кадр
+      или перегрузка (тогда ещё "status": 429/503, код закрытия 1013).
+    """
+    current_user = await run_io(get_websocket_user, websocket, db)
+    if current_user is None:
+        await websocket.close(code=1008, reason="Не авторизован")
+        return
+    await websocket.accept()
+
+    try:
+        decode = PcmDecoder(format, sample_rate)
+    except (ValueError, ImportError) as e:
+        await websocket.send_json({"type": "error", "detail": str(e)})
+        await websocket.close(code=1003)
+        return
+
+    # поток держит слот конвейера и лимит пользователя, но не бюджет очереди:
+    # его длина заранее неизвестна, а обрабатывается он в реальном времени
+    admitted = AsyncExitStack()
+    try:
+        await admitted.enter_async_context(admission.admit(current_user.id, 0.0))
+    except HTTPException as e:
+        await websocket.send_json({"type": "error", "status": e.status_code, "detail": e.detail})
+        await websocket.close(code=1013)
+        return
+
+    transcriber = StreamingTranscriber(task)
+    async with admitted:
+        try:
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    # клиент ушёл, не дождавшись конца — запись не сохраняем
+                    return
+                if message.get("bytes"):
+                    try:
+                        samples = decode(message["bytes"])
+                    except ValueError as e:
+                        await websocket.send_json({"type": "error", "detail": str(e)})
+                        await websocket.close(code=1007)
+                        return
+                    for event in await transcriber.feed(samples):
+                        await websocket.send_json(event)
+                elif message.get("text") == "stop":
+                    break
+
+            for event in await transcriber.feed(decode.flush()) + await transcriber.finish():
+                await websocket.send_json(event)
+
+            # Сохранение как у загруженного файла: WAV в S3, эмоции, полировка, БД
+            file_info = await storage_service.upload_bytes(
+                transcriber.wav_bytes(), f"stream-{datetime.utcnow():%Y%m%d-%H%M%S}.wav", "audio/wav"
+            )
+            result = await run_cpu(stream_result, transcriber.audio(), transcriber.segments)
+            result = await polish_result(result, language, True)
+            transcription = await run_io(save_transcription, db, file_info, result, language)
+
+            await websocket.send_json({"type": "done", **transcription_response(transcription).model_dump()})
+            await websocket.close()
+        except WebSocketDisconnect:
+            logger.info("Stream client disconnected")
@@ -1,19 +1,26 @@
 # app/api/v1/endpoints/transcriptions.py
 
 import os
+import json
+import asyncio
 import tempfile
 import logging
+from contextlib import AsyncExitStack, aclosing
+from typing import Optional
 
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Form
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Form, Request
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
 
 from app.services.storage_service import storage_service
-from app.services.diarization_service import diarize_file
-from app.services.whisper_service import transcribe_full, transcribe_segment
-from app.services.emotion_service import detect_emotion
-from app.services.polishing_service import polish_text, polish_segments
-from app.db.database import get_db
+from app.services.transcription_service import iter_transcription, transcribe_pipeline, save_transcription
+from app.services.chat_service import attach_transcription
+from app.services.polishing_service import polish_stats
+from app.services.job_service import create_job
+from app.services.admission_service import admission, estimate_audio_seconds, PRIORITY_DEMO
+from app.core.executors import run_io
+from app.db.database import SessionLocal, get_db
 from app.models.audio_model import AudioTranscription
 from app.api.auth.auth import get_current_user
 
@@ -24,6 +31,11 @@ router = APIRouter(
 
 logger = logging.getLogger(__name__)
 
+# блок копирования загрузки во временный файл
+UPLOAD_BLOCK_BYTES = 1 << 20
+# как часто поток прогресса проверяет, не ушёл ли клиент, с
+SSE_DISCONNECT_POLL_S = float(os.getenv("SSE_DISCONNECT_POLL_S", "1"))
+
 
 class SegmentOut(BaseModel):
     start: float
@@ -32,6 +44,9 @@ class SegmentOut(BaseModel):
     text: str
     emotion: str
     polished_text: str
+    translation: Optional[str] = None
+    confidence: Optional[dict[str, float]] = None
+    polish_skipped: bool = False
 
 
 class TranscriptionResponse(BaseModel):
@@ -46,6 +61,26 @@ class TranscriptionResponse(BaseModel):
     speakers: list[str]
     overall_emotion: str
     polished_text: str
+    translation: Optional[str] = None
+    polish_stats: Optional[dict[str, int]] = None
+
+
+async def save_temp_file(file: UploadFile) -> str:
+    """
+    Сохраняет загрузку во временный файл блоками по UPLOAD_BLOCK_BYTES,
+    запись на диск — в пуле I/O. При ошибке файл удаляется.
+    """
+    suffix = os.path.splitext(file.filename)[1]
+    await file.seek(0)
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
+        try:
+            while block := await file.read(UPLOAD_BLOCK_BYTES):
+                await run_io(tmp.write, block)
+        except BaseException:
+            tmp.close()
+            os.unlink(tmp.name)
+            raise
+        return tmp.name
 
 
 async def transcribe_audio_file(
@@ -60,76 +95,136 @@ async def transcribe_audio_file(
     if not file.filename.lower().endswith(('.mp3', '.wav', '.m4a', '.ogg', '.flac')):
         raise HTTPException(status_code=400, detail="Only audio files allowed")
 
-    # 2. Загрузка
+    # Допуск: 429/503 сразу, если очередь или лимит пользователя исчерпаны
+    async with admission.admit(current_user.id, estimate_audio_seconds(file)):
+        # 2. Загрузка
+        file_info = await storage_service.upload_file(file)
+
+        # 3. Временный файл
+        temp_path = await save_temp_file(file)
+
+        # 4-5. Диаризация, затем конвейер: Whisper и эмоции в пуле инференса, полировка параллельными запросами
+        try:
+            result = await transcribe_pipeline(temp_path, language, task, enable_diarization)
+        finally:
+            os.unlink(temp_path)
+
+        # 6. Сохранение
+        transcription = await run_io(save_transcription, db, file_info, result, language)
+
+        return transcription_response(transcription)
+
+
+async def enqueue_transcription_job(
+    file: UploadFile,
+    language: str,
+    task: str,
+    enable_diarization: bool,
+    db: Session,
+    current_user,
+    chat_session_id: int = None
+) -> JSONResponse:
+    """
+    Асинхронный режим: загружаем файл в S3, ставим задачу в очередь и сразу отвечаем 202.
+    Задачу выполнит любой воркер очереди, статус — GET /api/v1/jobs/{job_id}.
+    """
+    if not file.filename.lower().endswith(('.mp3', '.wav', '.m4a', '.ogg', '.flac')):
+        raise HTTPException(status_code=400, detail="Only audio files allowed")
+
     file_info = await storage_service.upload_file(file)
+    job = await run_io(
+        create_job, db, current_user.id, file_info, language, task, enable_diarization, chat_session_id
+    )
 
-    # 3. Временный файл
-    suffix = os.path.splitext(file.filename)[1]
-    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-        await file.seek(0)
-        tmp.write(await file.read())
-        temp_path = tmp.name
-
-    segments_data = []
-    speakers = []
-    overall_emotion = ""
-    formatted = ""
-    full_text = ""
-    full_polished = ""
-
-    # 4. Диаризация или целиком
-    if enable_diarization:
-        raw = diarize_file(temp_path)
-        for seg in raw:
-            if seg['speaker'] not in speakers:
-                speakers.append(seg['speaker'])
-            txt = transcribe_segment(temp_path, seg['start'], seg['end'], task=task)
-            emo = detect_emotion(temp_path)
-            segments_data.append({
-                "start": seg['start'],
-                "end": seg['end'],
-                "speaker": seg['speaker'],
-                "text": txt,
-                "emotion": emo
-            })
-
-        formatted = "\n".join(f"{s['speaker']}: {s['text']}" for s in segments_data)
-        full_text = " ".join(s['text'] for s in segments_data)
-
-        # 5. Полировка по сегментам
-        polished_segments = polish_segments(segments_data, language)
-        full_polished = " ".join(s['polished_text'] for s in polished_segments)
-        segments_data = polished_segments
-
-    else:
-        full_text = transcribe_full(temp_path, task=task)
-        formatted = full_text
-        overall_emotion = detect_emotion(temp_path)
-        full_polished = polish_text(full_text, language)
-        speakers = []
-        segments_data = []
-
-    os.unlink(temp_path)
-
-    # 6. Сохранение
-    transcription = AudioTranscription(
-        original_filename       = file_info["original_filename"],
-        s3_filename             = file_info["s3_filename"],
-        s3_url                  = file_info["s3_url"],
-        file_size               = file_info["size"],
-        duration                = None,
-        language                = language,
-        transcription           = full_text,
-        formatted_transcription = formatted,
-        speakers                = speakers,
-        diarization_data        = segments_data,
-        overall_emotion         = overall_emotion,
-        polished_text           = full_polished
+    return JSONResponse(
+        status_code=202,
+        content={"job_id": job.id, "status": job.status},
+        headers={"Location": f"/api/v1/jobs/{job.id}"}
     )
-    db.add(transcription)
-    db.commit()
-    db.refresh(transcription)
 
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def stream_transcription_progress(
+    file: UploadFile,
+    language: str,
+    task: str,
+    enable_diarization: bool,
+    current_user,
+    request: Request,
+    chat_session_id: int = None
+) -> StreamingResponse:
+    """
+    Режим прогресса (text/event-stream): событие diarization сразу после
+    диаризации, затем segment (SegmentOut) по мере готовности каждого сегмента
+    и done с id сохранённой транскрипции и polish_stats; при сбое — error.
+    Если клиент ушёл, конвейер останавливается, транскрипция не сохраняется.
+    """
+    if not file.filename.lower().endswith(('.mp3', '.wav', '.m4a', '.ogg', '.flac')):
+        raise HTTPException(status_code=400, detail="Only audio files allowed")
+
+    # Допуск держится до конца потока, а 429/503 уходят обычным HTTP-ответом
+    admitted = AsyncExitStack()
+    await admitted.enter_async_context(admission.admit(current_user.id, estimate_audio_seconds(file)))
+    try:
+        file_info = await storage_service.upload_file(file)
+        temp_path = await save_temp_file(file)
+    except BaseException:
+        await admitted.aclose()
+        raise
+
+    async def client_gone():
+        while not await request.is_disconnected():
+            await asyncio.sleep(SSE_DISCONNECT_POLL_S)
+
+    async def events():
+        # сессия запроса закрывается до отправки тела, у потока — своя
+        db = SessionLocal()
+        # uvicorn с ASGI 2.4 не прерывает поток при обрыве клиента: обрыв отслеживается здесь
+        watcher = asyncio.create_task(client_gone())
+        try:
+            async with aclosing(iter_transcription(temp_path, language, task, enable_diarization)) as pipeline:
+                while True:
+                    step = asyncio.ensure_future(anext(pipeline, None))
+                    await asyncio.wait((step, watcher), return_when=asyncio.FIRST_COMPLETED)
+                    if not step.done():
+                        # отмена шага останавливает стадии конвейера и удаляет PCM-кэш
+                        step.cancel()
+                        await asyncio.gather(step, return_exceptions=True)
+                        logger.info("Client left the progress stream, transcription stopped")
+                        return
+                    if (item := step.result()) is None:
+                        break
+                    event, data = item
+                    if event == "result":
+                        result = data
+                    else:
+                        yield sse_event(event, data)
+            if watcher.done():
+                return
+            transcription = await run_io(save_transcription, db, file_info, result, language)
+            if chat_session_id:
+                await run_io(attach_transcription, db, chat_session_id, transcription)
+            yield sse_event("done", {"id": transcription.id, "polish_stats": result.get("polish_stats")})
+        except Exception as e:
+            logger.exception("Transcription progress stream failed")
+            yield sse_event("error", {"detail": str(e)})
+        finally:
+            watcher.cancel()
+            os.unlink(temp_path)
+            db.close()
+            await admitted.aclose()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+def transcription_response(transcription: AudioTranscription) -> TranscriptionResponse:
     return TranscriptionResponse(
         id               = transcription.id,
         text             = transcription.transcription,
@@ -141,19 +236,32 @@ async def transcribe_audio_file(
         formatted_text   = transcription.formatted_transcription,
         speakers         = transcription.speakers,
         overall_emotion  = transcription.overall_emotion,
-        polished_text    = transcription.polished_text
+        polished_text    = transcription.polished_text,
+        translation      = transcription.translation,
+        polish_stats     = polish_stats(transcription.diarization_data) if transcription.diarization_data else None
     )
 
 
 @router.post("/transcribe", response_model=TranscriptionResponse)
 async def transcribe_endpoint(
+    request: Request,
     file: UploadFile = File(...),
     language: str = Form("kk"),
     task: str = Form("transcribe"),
     enable_diarization: bool = Form(True),
+    async_mode: bool = Form(False),
+    progress: bool = Form(False),
     db: Session = Depends(get_db),
     current_user = Depends(get_current_user)
 ):
+    if async_mode:
+        return await enqueue_transcription_job(
+            file, language, task, enable_diarization, db, current_user
+        )
+    if progress:
+        return await stream_transcription_progress(
+            file, language, task, enable_diarization, current_user, request
+        )
     return await transcribe_audio_file(
         file, language, task, enable_diarization, db, current_user
     )
@@ -163,89 +271,57 @@ async def transcribe_audio_demo(
     file: UploadFile,
     language: str = "kk",
     task: str = "transcribe",
-    enable_diarization: bool = True
+    enable_diarization: bool = True,
+    client_key: str = None
 ) -> TranscriptionResponse:
     # Копия функции transcribe_audio_file без сохранения в БД
-    
+
     # 1. Проверка формата файла
     if not file.filename.lower().endswith(('.mp3', '.wav', '.m4a', '.ogg', '.flac')):
         raise HTTPException(status_code=400, detail="Only audio files allowed")
 
-    # 2. Загрузка
-    file_info = await storage_service.upload_file(file)
-    
-    # 3-5. Обработка аудио (как в оригинальной функции)
-    suffix = os.path.splitext(file.filename)[1]
-    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-        await file.seek(0)
-        tmp.write(await file.read())
-        temp_path = tmp.name
-
-    segments_data = []
-    speakers = []
-    overall_emotion = ""
-    formatted = ""
-    full_text = ""
-    full_polished = ""
-
-    # 4. Диаризация или целиком
-    if enable_diarization:
-        raw = diarize_file(temp_path)
-        for seg in raw:
-            if seg['speaker'] not in speakers:
-                speakers.append(seg['speaker'])
-            txt = transcribe_segment(temp_path, seg['start'], seg['end'], task=task)
-            emo = detect_emotion(temp_path)
-            segments_data.append({
-                "start": seg['start'],
-                "end": seg['end'],
-                "speaker": seg['speaker'],
-                "text": txt,
-                "emotion": emo
-            })
-
-        formatted = "\n".join(f"{s['speaker']}: {s['text']}" for s in segments_data)
-        full_text = " ".join(s['text'] for s in segments_data)
-
-        # 5. Полировка по сегментам
-        polished_segments = polish_segments(segments_data, language)
-        full_polished = " ".join(s['polished_text'] for s in polished_segments)
-        segments_data = polished_segments
-
-    else:
-        full_text = transcribe_full(temp_path, task=task)
-        formatted = full_text
-        overall_emotion = detect_emotion(temp_path)
-        full_polished = polish_text(full_text, language)
-        speakers = []
-        segments_data = []
-
-    os.unlink(temp_path)
+    # Допуск в низкоприоритетную демо-очередь
+    async with admission.admit(("demo", client_key), estimate_audio_seconds(file), PRIORITY_DEMO):
+        # 2. Загрузка
+        file_info = await storage_service.upload_file(file)
+
+        # 3-5. Обработка аудио (как в оригинальной функции)
+        temp_path = await save_temp_file(file)
+
+        # 4-5. Диаризация, затем конвейер: Whisper и эмоции в пуле инференса, полировка параллельными запросами
+        try:
+            result = await transcribe_pipeline(temp_path, language, task, enable_diarization)
+        finally:
+            os.unlink(temp_path)
 
     # Возвращаем ответ без сохранения в БД
     return TranscriptionResponse(
         id=0,  # Демо ID
-        text=full_text,
+        text=result["text"],
         audio_url=file_info["s3_url"],
         language=language,
-        duration=0.0,  # Демо значение
+        duration=result["duration"],
         filename=file_info["original_filename"],
-        segments=segments_data,
-        formatted_text=formatted,
-        speakers=speakers,
-        overall_emotion=overall_emotion,
-        polished_text=full_polished
+        segments=result["segments"],
+        formatted_text=result["formatted_text"],
+        speakers=result["speakers"],
+        overall_emotion=result["overall_emotion"],
+        polished_text=result["polished_text"],
+        translation=result.get("translation"),
+        polish_stats=result.get("polish_stats")
     )
 
 
 @router.post("/transcribe-demo", response_model=TranscriptionResponse)
 async def transcribe_demo_endpoint(
+    request: Request,
     file: UploadFile = File(...),
     language: str = Form("kk"),
     task: str = Form("transcribe"),
     enable_diarization: bool = Form(True)
 ):
     return await transcribe_audio_demo(
-        file, language, task, enable_diarization
+        file, language, task, enable_diarization,
+        client_key=request.client.host if request.client else None
     )
 
@@ -0,0 +1,65 @@
+# app/core/executors.py
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+
+from app.core.tuning import tuning, apply_tuning
+
+# Пулы для блокирующей работы, чтобы event loop uvicorn оставался свободным:
+# cpu — инференс моделей (pyannote, Whisper, speechbrain),
+# io — OpenAI, S3 и SQLAlchemy.
+# без переменных окружения берётся рекомендация автотюнера (app/core/tuning.py)
+CPU_EXECUTOR = os.getenv("CPU_EXECUTOR", tuning.get("cpu_executor", "thread"))  # thread | process
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", tuning.get("cpu_workers", 1)))
+IO_WORKERS = int(os.getenv("IO_WORKERS", "16"))
+
+
+def _init_process_worker(counter):
+    from app.services.inference import warmup
+    # номер процесса выбирает его набор ядер из рекомендации тюнера
+    with counter.get_lock():
+        index = counter.value
+        counter.value += 1
+    apply_tuning(index)
+    warmup()
+
+
+def _make_cpu_executor() -> Executor:
+    if CPU_EXECUTOR == "process":
+        # spawn: fork после инициализации torch небезопасен; модели грузятся в каждом процессе сразу
+        ctx = multiprocessing.get_context("spawn")
+        return ProcessPoolExecutor(CPU_WORKERS, mp_context=ctx, initializer=_init_process_worker,
+                                   initargs=(ctx.Value("i", 0),))
+    return ThreadPoolExecutor(CPU_WORKERS, thread_name_prefix="inference")
+
+
+def warmup_inference():
+    """
+    Загружает модели при старте процесса, если инференс идёт в его потоках;
+    в process-пуле модели грузит каждый процесс сам (_init_process_worker).
+    """
+    if CPU_EXECUTOR == "thread":
+        from app.services.inference import warmup
+        apply_tuning()
+        warmup()
+
+
+cpu_executor = _make_cpu_executor()
+io_executor = ThreadPoolExecutor(IO_WORKERS, thread_name_prefix="io")
+
+
+async def run_cpu(fn, *args, **kwargs):
+    """Выполняет fn в пуле инференса. Для process-пула fn и аргументы должны сериализоваться."""
+    return await asyncio.get_running_loop().run_in_executor(cpu_executor, partial(fn, *args, **kwargs))
+
+
+async def run_io(fn, *args, **kwargs):
+    """Выполняет блокирующий сетевой/БД вызов в пуле ввода-вывода."""
+    return await asyncio.get_running_loop().run_in_executor(io_executor, partial(fn, *args, **kwargs))
+
+
+def shutdown_executors():
+    cpu_executor.shutdown(wait=False, cancel_futures=True)
+    io_executor.shutdown(wait=False, cancel_futures=True)
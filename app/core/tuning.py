@@ -0,0 +1,37 @@
+# app/core/tuning.py
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Рекомендация, записанная `python -m scripts.tune_workers`:
+# {"cpu_executor": "process", "cpu_workers": 4, "torch_threads": 8, "affinity": [[0, 1, ...], ...]}
+INFERENCE_TUNING_PATH = os.getenv("INFERENCE_TUNING_PATH", "inference_tuning.json")
+
+
+def load_tuning() -> dict:
+    if not os.path.exists(INFERENCE_TUNING_PATH):
+        return {}
+    with open(INFERENCE_TUNING_PATH, encoding="utf-8") as f:
+        return json.load(f)
+
+
+tuning = load_tuning()
+
+
+def apply_tuning(worker_index: int = None):
+    """
+    Применяет число потоков torch и, для процесса-воркера с номером
+    worker_index, привязку к своему набору ядер.
+    """
+    import torch
+
+    threads = int(os.getenv("TORCH_THREADS", tuning.get("torch_threads", 0)))
+    if threads:
+        torch.set_num_threads(threads)
+    affinity = tuning.get("affinity")
+    if worker_index is not None and affinity and hasattr(os, "sched_setaffinity"):
+        cores = affinity[worker_index % len(affinity)]
+        os.sched_setaffinity(0, cores)
+        logger.info(f"Inference worker {worker_index}: cores {cores}, torch threads {threads or 'default'}")
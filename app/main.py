@@ -4,17 +4,24 @@ os.environ['KMP_DUPLICATE_LIB_OK'] = 'TRUE'
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.api.v1.endpoints.transcriptions import router as transcriptions_router
+from app.api.v1.endpoints.streaming import router as streaming_router
 from app.api.v1.endpoints.chat_sessions import router as chat_sessions_router
+from app.api.v1.endpoints.jobs import router as jobs_router
+from app.api.v1.endpoints.metrics import router as metrics_router
 from app.api.auth.auth import router as auth_router
 from app.models.audio_model import Base
-from app.db.database import engine
+from app.db.database import init_schema
+from app.core.executors import shutdown_executors, warmup_inference
+from app.services.job_service import JOB_WORKERS, start_workers
+from app.services.polishing_service import close_client
 import secrets
+import threading
 from starlette.middleware.sessions import SessionMiddleware
 
 print(f"Using DATABASE_URL: {os.environ.get('DATABASE_URL')}")
 
 
-Base.metadata.create_all(bind=engine)
+init_schema(Base.metadata)
 
 app = FastAPI(
     title="Audio Transcription API",
@@ -43,6 +50,21 @@ app.include_router(
     tags=["transcription"]
 )
 
+app.include_router(
+    streaming_router,
+    tags=["transcription"]
+)
+
+app.include_router(
+    jobs_router,
+    tags=["jobs"]
+)
+
+app.include_router(
+    metrics_router,
+    tags=["metrics"]
+)
+
 app.include_router(
     chat_sessions_router,
     tags=["chat"]
@@ -58,6 +80,23 @@ app.include_router(
 if "S3_ACCESS_KEY" not in os.environ:
     logging.warning("S3 credentials not found in environment variables. Set them before running in production.")
 
+# Воркеры очереди внутри процесса API (JOB_WORKERS=0 — только внешние app.worker)
+_job_workers_stop = threading.Event()
+
+
+@app.on_event("startup")
+def startup():
+    warmup_inference()
+    start_workers(JOB_WORKERS, _job_workers_stop)
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    _job_workers_stop.set()
+    await close_client()
+    shutdown_executors()
+
+
 @app.get("/")
 async def root():
     return {"message": "Audio Transcription API is running"}
@@ -0,0 +1,102 @@
+"""
+Общий процесс с моделями (Whisper, pyannote, wav2vec2, FAISS):
+
+    MODEL_SERVER_ADDRESS=/tmp/whisper-models.sock MODEL_SERVER_AUTHKEY=<секрет> python -m app.model_server
+
+Воркеры uvicorn с тем же MODEL_SERVER_ADDRESS не загружают модели, а вызывают
+функции из app.services.inference здесь. Аудио приходит через shared memory.
+MODEL_SERVER_AUTHKEY обязателен и должен совпадать у сервера и воркеров.
+"""
+import logging
+import os
+import threading
+import traceback
+from contextlib import nullcontext
+from multiprocessing import resource_tracker, shared_memory
+from multiprocessing.connection import Listener
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+os.environ['KMP_DUPLICATE_LIB_OK'] = 'TRUE'
+
+from app.core.tuning import apply_tuning
+from app.services.audio_service import AudioBuffer
+from app.services.inference import FUNCTIONS, SCHEDULED, local_function
+from app.services.model_client import SharedAudio, parse_address, require_authkey
+
+logger = logging.getLogger(__name__)
+
+# одновременных вызовов моделей; остальные соединения ждут
+MODEL_SERVER_CONCURRENCY = int(os.getenv("MODEL_SERVER_CONCURRENCY", "1"))
+_slots = threading.BoundedSemaphore(MODEL_SERVER_CONCURRENCY)
+# без слота: статистика; вызовы, которые ждут планировщик батчей Whisper, —
+# слот, занятый на время ожидания, не дал бы батчу собраться из разных запросов;
+# поиск примеров — он почти всё время ждёт эмбеддинги OpenAI по сети,
+# а поиск FAISS только читает индекс
+_UNSLOTTED = {"whisper_batching_stats", "get_relevant_examples_batch"} | SCHEDULED
+
+
+def _attach(value, segments: list):
+    if not isinstance(value, SharedAudio):
+        return value
+    shm = shared_memory.SharedMemory(name=value.name)
+    # сегментом владеет клиент, трекер сервера не должен удалять его при выходе
+    resource_tracker.unregister(shm._name, "shared_memory")
+    segments.append(shm)
+    return AudioBuffer(np.ndarray((value.length,), dtype=np.float32, buffer=shm.buf), value.sample_rate)
+
+
+def _execute(name: str, args: list, kwargs: dict):
+    if name not in FUNCTIONS:
+        raise ValueError(f"Unknown function: {name}")
+    segments = []
+    try:
+        args = [_attach(a, segments) for a in args]
+        kwargs = {k: _attach(v, segments) for k, v in kwargs.items()}
+        with nullcontext() if name in _UNSLOTTED else _slots:
+            return local_function(name)(*args, **kwargs)
+    finally:
+        # массивы поверх буфера должны уйти раньше close()
+        args = kwargs = None
+        for shm in segments:
+            shm.close()
+
+
+def _serve(conn):
+    with conn:
+        while True:
+            try:
+                name, args, kwargs = conn.recv()
+            except EOFError:
+                return
+            try:
+                conn.send((True, _execute(name, args, kwargs)))
+            except Exception as e:
+                logger.error(f"{name} failed: {traceback.format_exc()}")
+                conn.send((False, f"{type(e).__name__}: {e}"))
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    # без ключа не стартуем: иначе вызвать модели сможет любой, кто достучится до адреса
+    authkey = require_authkey()
+    address = parse_address(os.getenv("MODEL_SERVER_ADDRESS", "127.0.0.1:8765"))
+    if isinstance(address, str) and os.path.exists(address):
+        os.unlink(address)
+
+    apply_tuning()
+    # модели загружаются один раз, до первого соединения
+    for name in FUNCTIONS:
+        local_function(name)
+    logger.info(f"Model server listening on {address}")
+
+    with Listener(address, authkey=authkey) as listener:
+        while True:
+            conn = listener.accept()
+            threading.Thread(target=_serve, args=(conn,), daemon=True).start()
+
+
+if __name__ == "__main__":
+    main()
@@ -21,3 +21,4 @@ class AudioTranscription(Base):
     speakers = Column(JSON, nullable=True)
     overall_emotion         = Column(String, nullable=True)
     polished_text           = Column(Text, nullable=True)
+    translation             = Column(Text, nullable=True)  # английский перевод при task=both
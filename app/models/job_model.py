@@ -0,0 +1,37 @@
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Text, Boolean
+from sqlalchemy.orm import relationship
+from datetime import datetime
+import uuid
+from app.models.audio_model import Base
+
+class TranscriptionJob(Base):
+    __tablename__ = "transcription_jobs"
+
+    id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    chat_session_id = Column(Integer, ForeignKey("chat_sessions.id"), nullable=True)
+    audio_transcription_id = Column(Integer, ForeignKey("audio_transcriptions.id"), nullable=True)
+    status = Column(String(20), default="queued", index=True)  # queued, running, done, failed
+    error = Column(Text, nullable=True)
+
+    # аренда задачи воркером: просроченная аренда значит, что воркер упал
+    worker_id = Column(String(100), nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True, index=True)
+    attempts = Column(Integer, default=0)
+
+    # параметры запуска
+    language = Column(String, default="kk")
+    task = Column(String, default="transcribe")
+    enable_diarization = Column(Boolean, default=True)
+
+    # загруженный файл
+    original_filename = Column(String, nullable=False)
+    s3_filename = Column(String, nullable=False)
+    s3_url = Column(String, nullable=False)
+    file_size = Column(Integer)
+
+    created_at = Column(DateTime, default=datetime.now)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+    # Отношения
+    audio_transcription = relationship("AudioTranscription")
@@ -0,0 +1,146 @@
+# app/services/admission_service.py
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import time
+from collections import defaultdict
+from contextlib import asynccontextmanager
+
+from fastapi import HTTPException, UploadFile
+
+from app.core.executors import CPU_WORKERS
+from app.services.inference import SCHEDULED
+
+# Приоритеты: меньше — раньше
+PRIORITY_USER = 0
+PRIORITY_DEMO = 1
+
+# суммарная оценочная длительность аудио в работе и в очереди, секунды
+MAX_QUEUED_AUDIO_S = float(os.getenv("ADMISSION_MAX_AUDIO_SECONDS", "14400"))
+# сколько конвейеров выполняется одновременно, остальные ждут в очереди;
+# с динамическим батчингом Whisper — вдвое больше, чтобы окна разных запросов сходились в батч
+MAX_RUNNING = int(os.getenv("ADMISSION_MAX_RUNNING", str(CPU_WORKERS * 2 if SCHEDULED else CPU_WORKERS)))
+# одновременных запросов на одного пользователя (для демо — на IP)
+PER_USER_LIMIT = int(os.getenv("ADMISSION_PER_USER", "2"))
+# демо-запросы не могут занять больше этой доли очереди
+DEMO_SHARE = float(os.getenv("ADMISSION_DEMO_SHARE", "0.25"))
+
+# байт на секунду звука для оценки длительности до декодирования
+_BYTES_PER_SECOND = {".wav": 32000, ".flac": 20000}
+DEFAULT_BYTES_PER_SECOND = float(os.getenv("ADMISSION_BYTES_PER_SECOND", "16000"))
+
+
+def estimate_audio_seconds(file: UploadFile) -> float:
+    """Грубая оценка длительности по размеру загрузки (UploadFile.size) и расширению."""
+    ext = os.path.splitext(file.filename)[1].lower()
+    size = file.size if file.size is not None else 0
+    return size / _BYTES_PER_SECOND.get(ext, DEFAULT_BYTES_PER_SECOND)
+
+
+class AdmissionController:
+    """
+    Допуск запросов к конвейеру транскрипции.
+    Ограничивает объём работы в очереди по оценочной длительности аудио
+    и число одновременных запросов на пользователя; свободные слоты
+    выполнения отдаются сначала пользователям, потом демо.
+    Работает внутри одного event loop, поэтому блокировки не нужны.
+    """
+
+    def __init__(self):
+        self.queued_seconds = 0.0
+        self.demo_seconds = 0.0
+        self.running = 0
+        self._per_user = defaultdict(int)
+        self._waiters = []  # (priority, seq, future)
+        self._seq = itertools.count()
+        # скользящая оценка скорости обработки (секунд аудио в секунду) для Retry-After
+        self._rate = 1.0
+
+    def _retry_after(self) -> str:
+        return str(min(max(math.ceil(self.queued_seconds / (self._rate * max(MAX_RUNNING, 1))), 1), 600))
+
+    def _reserve(self, key, seconds: float, priority: int):
+        if self._per_user.get(key, 0) >= PER_USER_LIMIT:
+            raise HTTPException(
+                status_code=429,
+                detail="Слишком много одновременных запросов",
+                headers={"Retry-After": self._retry_after()},
+            )
+        limit = MAX_QUEUED_AUDIO_S * (DEMO_SHARE if priority == PRIORITY_DEMO else 1.0)
+        used = self.demo_seconds if priority == PRIORITY_DEMO else self.queued_seconds
+        # пустая очередь принимает даже запрос длиннее лимита
+        if used and used + seconds > limit:
+            raise HTTPException(
+                status_code=503,
+                detail="Сервис перегружен, повторите позже",
+                headers={"Retry-After": self._retry_after()},
+            )
+        self._per_user[key] += 1
+        self.queued_seconds += seconds
+        if priority == PRIORITY_DEMO:
+            self.demo_seconds += seconds
+
+    def _unreserve(self, key, seconds: float, priority: int):
+        self._per_user[key] -= 1
+        if not self._per_user[key]:
+            del self._per_user[key]
+        self.queued_seconds -= seconds
+        if priority == PRIORITY_DEMO:
+            self.demo_seconds -= seconds
+
+    async def _acquire_slot(self, priority: int):
+        if self.running < MAX_RUNNING and not self._waiters:
+            self.running += 1
+            return
+        fut = asyncio.get_running_loop().create_future()
+        entry = (priority, next(self._seq), fut)
+        heapq.heappush(self._waiters, entry)
+        try:
+            await fut
+        except asyncio.CancelledError:
+            # клиент ушёл: убираем из очереди или возвращаем уже выданный слот
+            if fut.done() and not fut.cancelled():
+                self._release_slot()
+            elif entry in self._waiters:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+            raise
+
+    def _release_slot(self):
+        while self._waiters:
+            _, _, fut = heapq.heappop(self._waiters)
+            if not fut.done():
+                # слот переходит следующему без уменьшения running
+                fut.set_result(None)
+                return
+        self.running -= 1
+
+    @asynccontextmanager
+    async def admit(self, key, seconds: float, priority: int = PRIORITY_USER):
+        """Резервирует место в очереди (429/503 при перегрузке) и ждёт слот выполнения."""
+        self._reserve(key, seconds, priority)
+        try:
+            await self._acquire_slot(priority)
+            started = time.monotonic()
+            try:
+                yield
+            finally:
+                self._release_slot()
+                elapsed = time.monotonic() - started
+                if seconds and elapsed > 0:
+                    self._rate = 0.8 * self._rate + 0.2 * (seconds / elapsed)
+        finally:
+            self._unreserve(key, seconds, priority)
+
+    def stats(self) -> dict:
+        return {
+            "queued_audio_seconds": round(self.queued_seconds, 1),
+            "demo_audio_seconds": round(self.demo_seconds, 1),
+            "running": self.running,
+            "waiting": len(self._waiters),
+        }
+
+
+admission = AdmissionController()
@@ -0,0 +1,123 @@
+# app/services/audio_service.py
+import os
+import shutil
+import subprocess
+import tempfile
+
+import librosa
+import numpy as np
+import torch
+
+SAMPLE_RATE = 16000
+
+# куда декодировать записи (float32 PCM, ~230 МБ на час); лучше локальный SSD
+PCM_CACHE_DIR = os.getenv("PCM_CACHE_DIR") or tempfile.gettempdir()
+# блок чтения вывода ffmpeg
+DECODE_BLOCK_BYTES = 1 << 20
+
+
+class AudioBuffer:
+    """
+    Аудио, декодированное один раз на запрос: 16 кГц, моно, float32.
+    Диаризатор, Whisper и классификатор эмоций работают с ним напрямую,
+    без повторного чтения файла.
+
+    Буфер поверх PCM-кэша (decode_to_cache) читает отсчёты с диска через
+    numpy.memmap и в другие процессы передаётся ссылкой на файл, а не данными.
+    """
+
+    def __init__(self, waveform: np.ndarray, sample_rate: int = SAMPLE_RATE,
+                 pcm_path: str = None, pcm_offset: int = 0):
+        self.waveform = np.ascontiguousarray(waveform, dtype=np.float32)
+        self.sample_rate = sample_rate
+        self.pcm_path = pcm_path
+        self.pcm_offset = pcm_offset  # первый отсчёт буфера в файле кэша
+
+    @classmethod
+    def from_file(cls, path: str) -> "AudioBuffer":
+        waveform, _ = librosa.load(path, sr=SAMPLE_RATE, mono=True)
+        return cls(waveform)
+
+    @classmethod
+    def from_pcm(cls, path: str, offset: int = 0, length: int = None, sample_rate: int = SAMPLE_RATE) -> "AudioBuffer":
+        if length is None:
+            length = os.path.getsize(path) // 4 - offset
+        if length <= 0:
+            return cls(np.zeros(0, dtype=np.float32), sample_rate, path, offset)
+        # "c": копирование при записи, кэш на диске не меняется
+        waveform = np.memmap(path, dtype=np.float32, mode="c", offset=offset * 4, shape=(length,))
+        return cls(waveform, sample_rate, path, offset)
+
+    def __getstate__(self):
+        if self.pcm_path:
+            return {"pcm_path": self.pcm_path, "pcm_offset": self.pcm_offset,
+                    "length": len(self.waveform), "sample_rate": self.sample_rate}
+        return self.__dict__
+
+    def __setstate__(self, state):
+        if "length" in state:
+            state = AudioBuffer.from_pcm(state["pcm_path"], state["pcm_offset"], state["length"], state["sample_rate"]).__dict__
+        self.__dict__.update(state)
+
+    @property
+    def duration(self) -> float:
+        return len(self.waveform) / self.sample_rate
+
+    def to_sample(self, t: float) -> int:
+        return min(max(int(round(t * self.sample_rate)), 0), len(self.waveform))
+
+    def slice(self, start: float, end: float) -> np.ndarray:
+        # срез без копирования, с точностью до отсчёта
+        return self.waveform[self.to_sample(start):self.to_sample(end)]
+
+    def excerpt(self, start: float, end: float) -> "AudioBuffer":
+        """Фрагмент записи как отдельный буфер; время в нём отсчитывается от start."""
+        s0 = self.to_sample(start)
+        return AudioBuffer(self.slice(start, end), self.sample_rate,
+                           self.pcm_path, self.pcm_offset + s0 if self.pcm_path else 0)
+
+    def to_pyannote(self) -> dict:
+        return {"waveform": torch.from_numpy(self.waveform).unsqueeze(0), "sample_rate": self.sample_rate}
+
+    def delete_cache(self):
+        """Удаляет файл PCM-кэша; вызывает владелец буфера из decode_to_cache."""
+        if self.pcm_path and os.path.exists(self.pcm_path):
+            os.unlink(self.pcm_path)
+
+
+def _ffmpeg_decode(path: str, out):
+    with tempfile.TemporaryFile() as err:
+        proc = subprocess.Popen(
+            ["ffmpeg", "-nostdin", "-v", "error", "-i", path,
+             "-f", "f32le", "-ac", "1", "-ar", str(SAMPLE_RATE), "pipe:1"],
+            stdout=subprocess.PIPE, stderr=err,
+        )
+        with proc.stdout:
+            shutil.copyfileobj(proc.stdout, out, DECODE_BLOCK_BYTES)
+        if proc.wait() != 0:
+            err.seek(0)
+            raise RuntimeError(f"ffmpeg failed to decode {path}: {err.read().decode(errors='replace')[-500:]}")
+
+
+def decode_to_cache(path: str) -> AudioBuffer:
+    """
+    Декодирует файл в PCM-кэш на локальном диске и возвращает AudioBuffer поверх memmap.
+    С ffmpeg декодирование идёт потоком блоками, в памяти запись целиком не бывает;
+    без ffmpeg — через librosa. Кэш удаляется через delete_cache() в finally вызывающего.
+    """
+    fd, pcm_path = tempfile.mkstemp(suffix=".pcm", dir=PCM_CACHE_DIR)
+    try:
+        with os.fdopen(fd, "wb") as out:
+            if shutil.which("ffmpeg"):
+                _ffmpeg_decode(path, out)
+            else:
+                out.write(AudioBuffer.from_file(path).waveform.tobytes())
+        return AudioBuffer.from_pcm(pcm_path)
+    except BaseException:
+        os.unlink(pcm_path)
+        raise
+
+
+def as_audio_buffer(audio) -> AudioBuffer:
+    """Принимает путь к файлу или готовый AudioBuffer."""
+    return audio if isinstance(audio, AudioBuffer) else AudioBuffer.from_file(audio)
@@ -39,6 +39,14 @@ def add_transcription_to_chat(
     return chat_message
 
 
+def attach_transcription(db: Session, chat_session_id: int, transcription: AudioTranscription) -> ChatTranscription:
+    """Сообщение с транскрипцией в чат и отметка активности сессии."""
+    chat_message = add_transcription_to_chat(db, chat_session_id, transcription.id, transcription.transcription)
+    db.query(ChatSession).filter(ChatSession.id == chat_session_id).update({"updated_at": datetime.now()})
+    db.commit()
+    return chat_message
+
+
 def get_chat_history(db: Session, chat_session_id: int, user_id: int) -> List[ChatTranscription]:
     # Проверяем, принадлежит ли чат пользователю
     chat = get_chat_session(db, chat_session_id, user_id)
@@ -1,5 +1,12 @@
 from pyannote.audio import Pipeline as PyannotePipeline
+import logging
 import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import torch
+from app.services.audio_service import AudioBuffer
+
+logger = logging.getLogger(__name__)
 
 # инициализация
 diarizer = PyannotePipeline.from_pretrained(
@@ -9,10 +16,18 @@ diarizer = PyannotePipeline.from_pretrained(
 MIN_SEGMENT_LEN = 0.5
 MERGE_GAP = 0.2
 
-def diarize_file(audio_path: str):
-    ann = diarizer({"audio": audio_path})
-    raw = [{"start": round(t.start,2), "end": round(t.end,2), "speaker": spk}
-           for t,_,spk in ann.itertracks(yield_label=True)]
+# записи длиннее DIARIZATION_LONG_FORM_S диаризуются окнами DIARIZATION_WINDOW_S
+# с перекрытием DIARIZATION_OVERLAP_S; память pyannote ограничена длиной окна
+DIARIZATION_LONG_FORM_S = float(os.getenv("DIARIZATION_LONG_FORM_S", "3600"))
+DIARIZATION_WINDOW_S = float(os.getenv("DIARIZATION_WINDOW_S", "1200"))
+DIARIZATION_OVERLAP_S = float(os.getenv("DIARIZATION_OVERLAP_S", "60"))
+# окон одновременно; каждое держит в памяти свою часть вычислений pyannote
+DIARIZATION_WORKERS = int(os.getenv("DIARIZATION_WORKERS", "1"))
+# косинусное расстояние между центроидами, до которого говорящие разных окон — один человек
+DIARIZATION_CLUSTER_THRESHOLD = float(os.getenv("DIARIZATION_CLUSTER_THRESHOLD", "0.6"))
+
+
+def _merge(raw: list[dict]) -> list[dict]:
     # фильтр и слияние близких сегментов
     filt = [s for s in raw if s['end']-s['start']>=MIN_SEGMENT_LEN]
     merged = []
@@ -23,3 +38,101 @@ def diarize_file(audio_path: str):
         else:
             merged.append(seg.copy())
     return merged
+
+
+def _diarize_window(audio: AudioBuffer, start: float, end: float) -> tuple[list[dict], dict]:
+    """Диаризация одного окна: сегменты на шкале записи и центроиды говорящих окна."""
+    waveform = torch.from_numpy(audio.slice(start, end)).unsqueeze(0)
+    ann, embeddings = diarizer({"waveform": waveform, "sample_rate": audio.sample_rate}, return_embeddings=True)
+    turns = [{"start": start + t.start, "end": start + t.end, "speaker": spk}
+             for t, _, spk in ann.itertracks(yield_label=True)]
+    return turns, dict(zip(ann.labels(), embeddings))
+
+
+def _cluster(centroids: list[np.ndarray], windows: list[int]) -> list[int]:
+    """
+    Агломеративная кластеризация (средняя связь, косинусное расстояние)
+    локальных говорящих всех окон. Говорящие одного окна pyannote уже
+    развёл, поэтому такие кластеры не сливаются.
+    """
+    x = np.stack(centroids).astype(np.float64)
+    x /= np.linalg.norm(x, axis=1, keepdims=True)
+    dist = 1.0 - x @ x.T
+    # NaN — у говорящего слишком мало речи для эмбеддинга, остаётся отдельным
+    dist[np.isnan(dist)] = np.inf
+    clusters = [[i] for i in range(len(centroids))]
+    while True:
+        best, pair = DIARIZATION_CLUSTER_THRESHOLD, None
+        for a in range(len(clusters)):
+            wa = {windows[i] for i in clusters[a]}
+            for b in range(a + 1, len(clusters)):
+                if wa & {windows[i] for i in clusters[b]}:
+                    continue
+                d = dist[np.ix_(clusters[a], clusters[b])].mean()
+                if d < best:
+                    best, pair = d, (a, b)
+        if pair is None:
+            break
+        a, b = pair
+        clusters[a] += clusters.pop(b)
+    labels = [0] * len(centroids)
+    for k, members in enumerate(clusters):
+        for i in members:
+            labels[i] = k
+    return labels
+
+
+def diarize_long(audio: AudioBuffer) -> list[dict]:
+    """
+    Диаризация длинной записи окнами с перекрытием. Каждое окно отдаёт сегменты,
+    середина которых лежит в его «своей» части (перекрытие делится пополам),
+    и центроиды говорящих; говорящие окон сводятся в общих кластеризацией.
+    Упавшее окно повторяется один раз, затем пропускается с ошибкой в логе.
+    """
+    step = DIARIZATION_WINDOW_S - DIARIZATION_OVERLAP_S
+    starts = [float(st) for st in np.arange(0.0, max(audio.duration - DIARIZATION_OVERLAP_S, 1e-6), step)]
+    bounds = [(st, min(st + DIARIZATION_WINDOW_S, audio.duration)) for st in starts]
+
+    def run(bound):
+        for attempt in (1, 2):
+            try:
+                return _diarize_window(audio, *bound)
+            except Exception:
+                logger.exception(f"Diarization window {bound[0]:.0f}-{bound[1]:.0f}s failed (attempt {attempt})")
+        return [], {}
+
+    with ThreadPoolExecutor(DIARIZATION_WORKERS) as pool:
+        results = list(pool.map(run, bounds))
+
+    keys, centroids, windows = [], [], []
+    for w, (_, embeddings) in enumerate(results):
+        for label, emb in embeddings.items():
+            keys.append((w, label))
+            centroids.append(emb)
+            windows.append(w)
+    global_label = dict(zip(keys, _cluster(centroids, windows))) if keys else {}
+
+    raw = []
+    for w, ((st, ed), (turns, _)) in enumerate(zip(bounds, results)):
+        own_start = st + DIARIZATION_OVERLAP_S / 2 if w > 0 else 0.0
+        own_end = ed - DIARIZATION_OVERLAP_S / 2 if w < len(bounds) - 1 else audio.duration
+        for t in turns:
+            if own_start <= (t["start"] + t["end"]) / 2 < own_end:
+                # говорящий без эмбеддинга остаётся отдельным
+                raw.append({**t, "speaker": global_label.get((w, t["speaker"]), (w, t["speaker"]))})
+
+    # имена SPEAKER_XX в порядке первого появления
+    names = {}
+    for t in sorted(raw, key=lambda x: x["start"]):
+        names.setdefault(t["speaker"], f"SPEAKER_{len(names):02d}")
+    return [{"start": round(t["start"], 2), "end": round(t["end"], 2), "speaker": names[t["speaker"]]} for t in raw]
+
+
+def diarize_file(audio: str | AudioBuffer):
+    if isinstance(audio, AudioBuffer) and audio.duration > DIARIZATION_LONG_FORM_S:
+        return _merge(diarize_long(audio))
+    # pyannote принимает и путь, и уже декодированный {"waveform", "sample_rate"}
+    ann = diarizer(audio.to_pyannote() if isinstance(audio, AudioBuffer) else {"audio": audio})
+    raw = [{"start": round(t.start,2), "end": round(t.end,2), "speaker": spk}
+           for t,_,spk in ann.itertracks(yield_label=True)]
+    return _merge(raw)
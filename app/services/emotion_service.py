@@ -1,5 +1,8 @@
 import os
+import torch
+from torch.nn.utils.rnn import pad_sequence
 from speechbrain.inference.interfaces import foreign_class
+from app.services.audio_service import AudioBuffer
 
 # 1. Инициализация классификатора
 # Не забыть скачать «custom_interface.py» из репозитория модели
@@ -10,13 +13,39 @@ classifier = foreign_class(
     run_opts={"device": os.getenv("DEVICE_NAME", "cpu")}
 )
 
-def detect_emotion(audio_path: str) -> str:
-    """
-    Классифицирует файл audio_path и возвращает строку-метку эмоции.
-    Если модель вернула список, берём первый элемент.
-    """
-    out_prob, score, idx, label = classifier.classify_file(audio_path)
+EMOTION_BATCH_SIZE = int(os.getenv("EMOTION_BATCH_SIZE", "8"))
+
+def _label(label) -> str:
     # если label — список или кортеж, разворачиваем
     if isinstance(label, (list, tuple)) and label:
         label = label[0]
     return str(label)
+
+def detect_emotions(audio: AudioBuffer, windows: list[tuple[float, float]], batch_size: int = None) -> list[str]:
+    """
+    Метки эмоций для окон (start, end) одной записи.
+    Срезы дополняются нулями до самого длинного в батче, относительные
+    длины передаются в модель как маска.
+    """
+    batch_size = batch_size or EMOTION_BATCH_SIZE
+    labels = [""] * len(windows)
+    # сортировка по длине уменьшает дополнение внутри батча
+    order = [i for i in sorted(range(len(windows)), key=lambda i: windows[i][1] - windows[i][0])
+             if len(audio.slice(*windows[i])) > 0]
+    for b in range(0, len(order), batch_size):
+        idx = order[b:b+batch_size]
+        wavs = [torch.from_numpy(audio.slice(*windows[i])) for i in idx]
+        lens = torch.tensor([len(w) for w in wavs], dtype=torch.float32)
+        out_prob, score, index, text_lab = classifier.classify_batch(pad_sequence(wavs, batch_first=True), lens / lens.max())
+        for i, lab in zip(idx, text_lab):
+            labels[i] = _label(lab)
+    return labels
+
+def detect_emotion(audio: str | AudioBuffer) -> str:
+    """
+    Классифицирует аудио (путь или AudioBuffer) и возвращает строку-метку эмоции.
+    """
+    if isinstance(audio, AudioBuffer):
+        return detect_emotions(audio, [(0.0, audio.duration)])[0]
+    out_prob, score, idx, label = classifier.classify_file(audio)
+    return _label(label)
@@ -0,0 +1,105 @@
+# app/services/inference.py
+"""
+Единая точка вызова моделей для конвейера.
+
+Без MODEL_SERVER_ADDRESS функции выполняются в текущем процессе; модуль
+сервиса (и его модель) импортируется при первом вызове. С адресом вызовы
+уходят в общий процесс `python -m app.model_server`, и воркеры uvicorn
+не загружают модели вовсе.
+"""
+import importlib
+import os
+
+from app.services.audio_service import AudioBuffer
+
+MODEL_SERVER_ADDRESS = os.getenv("MODEL_SERVER_ADDRESS")
+# с динамическим батчингом окна Whisper декодирует поток планировщика
+# (whisper_service.BatchScheduler), а transcribe_segments только готовит
+# признаки и ждёт свой батч; такой вызов не должен занимать слот инференса,
+# иначе при одном слоте окна других запросов в батч не попадут
+WHISPER_DYNAMIC_BATCHING = os.getenv("WHISPER_DYNAMIC_BATCHING", "0") == "1"
+SCHEDULED = {"transcribe_segments"} if WHISPER_DYNAMIC_BATCHING else set()
+
+# имя вызова -> (модуль, функция); сервер модели выполняет только их
+FUNCTIONS = {
+    "diarize_file": ("app.services.diarization_service", "diarize_file"),
+    "transcribe_segments": ("app.services.whisper_service", "transcribe_segments"),
+    "transcribe_full": ("app.services.whisper_service", "transcribe_full"),
+    "whisper_batching_stats": ("app.services.whisper_service", "batching_stats"),
+    "detect_emotions": ("app.services.emotion_service", "detect_emotions"),
+    "get_relevant_examples_batch": ("app.services.retrieval_service", "get_relevant_examples_batch"),
+}
+
+
+def local_function(name: str):
+    module, func = FUNCTIONS[name]
+    return getattr(importlib.import_module(module), func)
+
+
+def call(name: str, *args, **kwargs):
+    if MODEL_SERVER_ADDRESS:
+        from app.services.model_client import model_client
+        return model_client.call(name, *args, **kwargs)
+    return local_function(name)(*args, **kwargs)
+
+
+def waits_for_scheduler(name: str) -> bool:
+    """
+    Вызов ждёт общий планировщик батчей, и его можно выполнять в пуле
+    ввода-вывода. В process-пуле у каждого процесса свой планировщик,
+    поэтому там вызов остаётся в пуле инференса.
+    """
+    from app.core.executors import CPU_EXECUTOR
+    return name in SCHEDULED and (bool(MODEL_SERVER_ADDRESS) or CPU_EXECUTOR == "thread")
+
+
+async def run_scheduled(fn, *args, **kwargs):
+    """
+    Вызов функции инференса fn из этого модуля в подходящем пуле: если она
+    ждёт общий планировщик батчей (waits_for_scheduler), пул инференса
+    на время ожидания не занимается.
+    """
+    from app.core.executors import run_cpu, run_io
+    run = run_io if waits_for_scheduler(fn.__name__) else run_cpu
+    return await run(fn, *args, **kwargs)
+
+
+def warmup():
+    """Загружает модели заранее, чтобы первый запрос не ждал импорта."""
+    if MODEL_SERVER_ADDRESS:
+        return
+    for module in sorted({module for module, _ in FUNCTIONS.values()}):
+        importlib.import_module(module)
+
+
+def diarize_file(audio: AudioBuffer) -> list[dict]:
+    return call("diarize_file", audio)
+
+
+def transcribe_segments(audio: AudioBuffer, windows: list[tuple[float, float]], task="transcribe",
+                        batch_size: int = None, with_confidence: bool = False):
+    return call("transcribe_segments", audio, windows, task=task, batch_size=batch_size, with_confidence=with_confidence)
+
+
+def transcribe_full(audio: AudioBuffer, task="transcribe", batch_size: int = None):
+    return call("transcribe_full", audio, task=task, batch_size=batch_size)
+
+
+def whisper_batching_stats() -> dict:
+    """
+    Статистика планировщика батчей Whisper из процесса, где идёт инференс.
+    В process-пуле у каждого процесса свой планировщик, а в этом процессе
+    модели нет — модуль Whisper ради статистики не импортируется.
+    """
+    from app.core.executors import CPU_EXECUTOR
+    if not WHISPER_DYNAMIC_BATCHING or (not MODEL_SERVER_ADDRESS and CPU_EXECUTOR != "thread"):
+        return {"enabled": False}
+    return call("whisper_batching_stats")
+
+
+def detect_emotions(audio: AudioBuffer, windows: list[tuple[float, float]], batch_size: int = None) -> list[str]:
+    return call("detect_emotions", audio, windows, batch_size=batch_size)
+
+
+def get_relevant_examples_batch(texts: list[str], k: int = 3) -> list[list[str]]:
+    return call("get_relevant_examples_batch", texts, k=k)
@@ -0,0 +1,244 @@
+# app/services/job_service.py
+import asyncio
+import logging
+import os
+import socket
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session
+
+from app.db.database import SessionLocal
+from app.models.chat_session_model import ChatSession, ChatTranscription
+from app.models.job_model import TranscriptionJob
+from app.services.polishing_service import close_client
+from app.services.storage_service import storage_service
+from app.services.transcription_service import transcribe_pipeline, build_transcription
+
+logger = logging.getLogger(__name__)
+
+# Воркеры очереди внутри процесса API; 0 — только отдельные `python -m app.worker`
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# аренда задачи продлевается каждые LEASE/3 секунд, пока воркер жив
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "120"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1.0"))
+
+
+def create_job(
+        db: Session,
+        user_id: int,
+        file_info: dict,
+        language: str,
+        task: str,
+        enable_diarization: bool,
+        chat_session_id: Optional[int] = None
+) -> TranscriptionJob:
+    job = TranscriptionJob(
+        user_id=user_id,
+        chat_session_id=chat_session_id,
+        language=language,
+        task=task,
+        enable_diarization=enable_diarization,
+        original_filename=file_info["original_filename"],
+        s3_filename=file_info["s3_filename"],
+        s3_url=file_info["s3_url"],
+        file_size=file_info["size"]
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def get_job(db: Session, job_id: str, user_id: int) -> Optional[TranscriptionJob]:
+    return db.query(TranscriptionJob).filter(TranscriptionJob.id == job_id, TranscriptionJob.user_id == user_id).first()
+
+
+def _claimable(now: datetime):
+    # новая задача или задача, чей воркер перестал продлевать аренду
+    return or_(
+        TranscriptionJob.status == "queued",
+        and_(TranscriptionJob.status == "running", TranscriptionJob.lease_expires_at < now)
+    )
+
+
+def _fail_exhausted(db: Session, now: datetime):
+    db.query(TranscriptionJob).filter(
+        TranscriptionJob.status == "running",
+        TranscriptionJob.lease_expires_at < now,
+        TranscriptionJob.attempts >= JOB_MAX_ATTEMPTS
+    ).update({"status": "failed", "error": "Воркер не завершил задачу", "worker_id": None},
+             synchronize_session=False)
+    db.commit()
+
+
+def claim_job(db: Session, worker_id: str) -> Optional[TranscriptionJob]:
+    """
+    Забирает самую старую доступную задачу и берёт её в аренду.
+    PostgreSQL/MySQL: SELECT ... FOR UPDATE SKIP LOCKED, воркеры не ждут друг друга.
+    SQLite: SKIP LOCKED нет, захват условным UPDATE по номеру попытки.
+    """
+    now = datetime.now()
+    _fail_exhausted(db, now)
+    lease = {
+        "status": "running",
+        "worker_id": worker_id,
+        "lease_expires_at": now + timedelta(seconds=JOB_LEASE_SECONDS),
+    }
+    query = db.query(TranscriptionJob).filter(_claimable(now)).order_by(TranscriptionJob.created_at)
+
+    if db.bind.dialect.name in ("postgresql", "mysql"):
+        job = query.with_for_update(skip_locked=True).first()
+        if not job:
+            db.commit()
+            return None
+        for key, value in lease.items():
+            setattr(job, key, value)
+        job.attempts += 1
+        db.commit()
+        return job
+
+    job = query.first()
+    if not job:
+        return None
+    claimed = db.query(TranscriptionJob).filter(
+        TranscriptionJob.id == job.id,
+        TranscriptionJob.attempts == job.attempts,
+        _claimable(now)
+    ).update({**lease, "attempts": job.attempts + 1}, synchronize_session=False)
+    db.commit()
+    if not claimed:
+        # задачу перехватил другой воркер
+        return None
+    db.refresh(job)
+    return job
+
+
+def renew_lease(job_id: str, worker_id: str) -> bool:
+    db = SessionLocal()
+    try:
+        renewed = db.query(TranscriptionJob).filter(
+            TranscriptionJob.id == job_id,
+            TranscriptionJob.worker_id == worker_id,
+            TranscriptionJob.status == "running"
+        ).update({"lease_expires_at": datetime.now() + timedelta(seconds=JOB_LEASE_SECONDS)},
+                 synchronize_session=False)
+        db.commit()
+        return bool(renewed)
+    finally:
+        db.close()
+
+
+def _heartbeat(job_id: str, worker_id: str, done: threading.Event):
+    while not done.wait(JOB_LEASE_SECONDS / 3):
+        try:
+            if not renew_lease(job_id, worker_id):
+                return
+        except Exception:
+            logger.exception(f"Lease renewal for job {job_id} failed")
+
+
+def _release(db: Session, job_id: str, worker_id: str, values: dict) -> bool:
+    """
+    Финальная запись статуса условным UPDATE: строка меняется, только если
+    задача всё ещё арендована этим воркером. Проверка и запись — одна
+    операция, поэтому воркер, перехвативший просроченную аренду, не будет
+    перезаписан. Изменение не коммитится: остальное пишется в той же транзакции.
+    """
+    released = db.query(TranscriptionJob).filter(
+        TranscriptionJob.id == job_id,
+        TranscriptionJob.worker_id == worker_id,
+        TranscriptionJob.status == "running"
+    ).update({**values, "worker_id": None, "lease_expires_at": None}, synchronize_session=False)
+    return bool(released)
+
+
+async def _run_pipeline(job: TranscriptionJob, audio_path: str) -> dict:
+    # у воркера свой цикл событий на задачу: его клиент OpenAI закрывается вместе с ним
+    try:
+        return await transcribe_pipeline(audio_path, job.language, job.task, job.enable_diarization)
+    finally:
+        await close_client()
+
+
+def process_job(db: Session, job: TranscriptionJob, worker_id: str):
+    """
+    Выполняет арендованную задачу: скачивает аудио по ключу S3, прогоняет
+    конвейер и одной транзакцией сохраняет AudioTranscription, сообщение
+    в чат и статус. Ошибка возвращает задачу в очередь, пока есть попытки.
+    """
+    done = threading.Event()
+    threading.Thread(target=_heartbeat, args=(job.id, worker_id, done), daemon=True).start()
+    job_id, attempts = job.id, job.attempts
+    suffix = os.path.splitext(job.original_filename)[1]
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
+        audio_path = tmp.name
+    try:
+        storage_service.download_file(job.s3_filename, audio_path)
+        # конвейер стадий; инференс — в общем пуле, чтобы не превышать CPU_WORKERS
+        result = asyncio.run(_run_pipeline(job, audio_path))
+
+        file_info = {
+            "original_filename": job.original_filename,
+            "s3_filename": job.s3_filename,
+            "s3_url": job.s3_url,
+            "size": job.file_size,
+        }
+        transcription = build_transcription(file_info, result, job.language)
+        db.add(transcription)
+        db.flush()
+        if not _release(db, job_id, worker_id, {"status": "done", "audio_transcription_id": transcription.id}):
+            db.rollback()
+            logger.warning(f"Job {job_id} lease lost, result discarded")
+            return
+        if job.chat_session_id:
+            db.add(ChatTranscription(
+                chat_session_id=job.chat_session_id,
+                audio_transcription_id=transcription.id,
+                message=transcription.transcription
+            ))
+            db.query(ChatSession).filter(ChatSession.id == job.chat_session_id).update({"updated_at": datetime.now()})
+        db.commit()
+    except Exception as e:
+        logger.exception(f"Transcription job {job_id} failed (attempt {attempts})")
+        db.rollback()
+        status = "queued" if attempts < JOB_MAX_ATTEMPTS else "failed"
+        if _release(db, job_id, worker_id, {"status": status, "error": str(e)}):
+            db.commit()
+        else:
+            db.rollback()
+    finally:
+        done.set()
+        os.unlink(audio_path)
+
+
+def run_worker(worker_id: str, stop: threading.Event):
+    """Цикл воркера: берёт задачи из таблицы, пока не выставлен stop."""
+    logger.info(f"Job worker {worker_id} started")
+    while not stop.is_set():
+        db = SessionLocal()
+        try:
+            job = claim_job(db, worker_id)
+            if job:
+                process_job(db, job, worker_id)
+        except Exception:
+            logger.exception(f"Job worker {worker_id} error")
+            job = None
+        finally:
+            db.close()
+        if not job:
+            stop.wait(JOB_POLL_INTERVAL)
+
+
+def start_workers(count: int, stop: threading.Event, prefix: str = None) -> list[threading.Thread]:
+    prefix = prefix or f"{socket.gethostname()}-{os.getpid()}"
+    threads = []
+    for i in range(count):
+        thread = threading.Thread(target=run_worker, args=(f"{prefix}-{i}", stop), name=f"job-worker-{i}", daemon=True)
+        thread.start()
+        threads.append(thread)
+    return threads
@@ -0,0 +1,85 @@
+# app/services/model_client.py
+import os
+import threading
+from multiprocessing import shared_memory
+from multiprocessing.connection import Client
+
+import numpy as np
+
+from app.services.audio_service import AudioBuffer
+
+# общий секрет сервера и клиентов; значения по умолчанию нет — без него не работают оба
+MODEL_SERVER_AUTHKEY = os.getenv("MODEL_SERVER_AUTHKEY", "").encode()
+
+
+def require_authkey() -> bytes:
+    if not MODEL_SERVER_AUTHKEY:
+        raise RuntimeError("MODEL_SERVER_AUTHKEY is not set: the model server and its clients need a shared secret")
+    return MODEL_SERVER_AUTHKEY
+
+
+def parse_address(address: str):
+    """'host:port' — TCP, иначе путь к unix-сокету."""
+    host, sep, port = address.rpartition(":")
+    return (host, int(port)) if sep and port.isdigit() else address
+
+
+class SharedAudio:
+    """Ссылка на аудио в разделяемой памяти: по соединению идёт только имя сегмента."""
+
+    def __init__(self, name: str, length: int, sample_rate: int):
+        self.name = name
+        self.length = length
+        self.sample_rate = sample_rate
+
+
+class ModelClient:
+    """
+    Клиент сервера моделей. Соединение своё у каждого потока;
+    AudioBuffer в аргументах передаётся через shared memory, а не pickle;
+    буфер поверх PCM-кэша — путём к файлу кэша.
+    """
+
+    def __init__(self, address: str):
+        self.address = parse_address(address)
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or conn.closed:
+            conn = self._local.conn = Client(self.address, authkey=require_authkey())
+        return conn
+
+    @staticmethod
+    def _share(value, segments: list):
+        if not isinstance(value, AudioBuffer) or value.pcm_path:
+            # буфер поверх PCM-кэша сервер откроет сам через memmap по пути
+            return value
+        shm = shared_memory.SharedMemory(create=True, size=max(value.waveform.nbytes, 1))
+        segments.append(shm)
+        np.ndarray(value.waveform.shape, dtype=np.float32, buffer=shm.buf)[:] = value.waveform
+        return SharedAudio(shm.name, len(value.waveform), value.sample_rate)
+
+    def call(self, name: str, *args, **kwargs):
+        segments = []
+        try:
+            args = [self._share(a, segments) for a in args]
+            kwargs = {k: self._share(v, segments) for k, v in kwargs.items()}
+            conn = self._connection()
+            try:
+                conn.send((name, args, kwargs))
+                ok, payload = conn.recv()
+            except (EOFError, OSError):
+                # сервер перезапустился — соединение пересоздастся при следующем вызове
+                self._local.conn = None
+                raise
+        finally:
+            for shm in segments:
+                shm.close()
+                shm.unlink()
+        if not ok:
+            raise RuntimeError(f"Model server error in {name}: {payload}")
+        return payload
+
+
+model_client = ModelClient(os.getenv("MODEL_SERVER_ADDRESS", "127.0.0.1:8765"))
@@ -1,18 +1,213 @@
-from openai import OpenAI
+import asyncio
+import json
+import logging
 import os
+import random
+import re
+import threading
+import time
+import weakref
+
+from openai import AsyncOpenAI, APIConnectionError, InternalServerError, RateLimitError
+
+logger = logging.getLogger(__name__)
 
-# Инициализация OpenAI клиента
-_openai = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 GPT_MODEL = os.getenv("GPT_MODEL", "gpt-4o")
+# одновременных запросов полировки на один вызов polish_segments
+POLISH_CONCURRENCY = int(os.getenv("POLISH_CONCURRENCY", "8"))
+# лимиты аккаунта OpenAI на процесс; 0 — без ограничения
+OPENAI_RPM = int(os.getenv("OPENAI_RPM", "500"))
+OPENAI_TPM = int(os.getenv("OPENAI_TPM", "200000"))
+# повторы на 429/5xx/обрыв соединения: пауза POLISH_BACKOFF_S * 2^n, не больше POLISH_BACKOFF_MAX_S
+POLISH_MAX_RETRIES = int(os.getenv("POLISH_MAX_RETRIES", "5"))
+POLISH_BACKOFF_S = float(os.getenv("POLISH_BACKOFF_S", "1"))
+POLISH_BACKOFF_MAX_S = float(os.getenv("POLISH_BACKOFF_MAX_S", "30"))
+# потолок max_tokens ответа модели
+POLISH_MAX_OUTPUT_TOKENS = int(os.getenv("POLISH_MAX_OUTPUT_TOKENS", "16384"))
+# упаковка соседних сегментов в один запрос с JSON-ответом по номерам сегментов
+POLISH_PACKED = os.getenv("POLISH_PACKED", "1") == "1"
+# бюджет текста сегментов на один упакованный запрос, в токенах
+POLISH_PACK_TOKENS = int(os.getenv("POLISH_PACK_TOKENS", "1500"))
+POLISH_PACK_EXAMPLES = int(os.getenv("POLISH_PACK_EXAMPLES", "5"))
+# длинный текст без диаризации полируется кусками по POLISH_TEXT_CHUNK_TOKENS по границам
+# предложений; соседние куски перекрываются на POLISH_TEXT_OVERLAP_SENTENCES предложений
+POLISH_TEXT_CHUNK_TOKENS = int(os.getenv("POLISH_TEXT_CHUNK_TOKENS", "1000"))
+POLISH_TEXT_OVERLAP_SENTENCES = int(os.getenv("POLISH_TEXT_OVERLAP_SENTENCES", "1"))
+# сегменты, в которых Whisper уверен, не полируются и не ищут примеров в корпусе:
+# средний log-prob не ниже порога (0 — полировать всё), без признаков зацикливания и тишины
+POLISH_SKIP_LOGPROB = float(os.getenv("POLISH_SKIP_LOGPROB", "-0.3"))
+POLISH_SKIP_MAX_COMPRESSION = float(os.getenv("POLISH_SKIP_MAX_COMPRESSION", "2.4"))
+POLISH_SKIP_MAX_NO_SPEECH = float(os.getenv("POLISH_SKIP_MAX_NO_SPEECH", "0.6"))
+
+# OPENAI_BASE_URL (например, локальный scripts/fake_openai.py) клиент читает из окружения сам
+OPENAI_ENABLED = bool(os.getenv("OPENAI_API_KEY"))
 
 
-def polish_text(text: str, language: str, prompt_template: str = None) -> str:
+class RateLimiter:
     """
-    Полировка полноценного текста транскрипции.
-    Используется в ветке без диаризации.
+    Два ведра токенов: запросы в минуту и токены в минуту.
+    Потокобезопасно и не привязано к циклу событий — одно на процесс,
+    общее для запросов API и воркеров очереди задач.
     """
-    if not _openai:
-        return text
+
+    def __init__(self, rpm: int, tpm: int):
+        self.capacity = (rpm, tpm)
+        self.levels = [float(rpm), float(tpm)]
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self, tokens: int) -> float:
+        # списывает запрос сразу (уровень может уйти в минус — это очередь) и возвращает паузу
+        with self._lock:
+            now = time.monotonic()
+            elapsed, self.updated = now - self.updated, now
+            wait = 0.0
+            for i, need in enumerate((1, tokens)):
+                capacity = self.capacity[i]
+                if not capacity:
+                    continue
+                rate = capacity / 60
+                self.levels[i] = min(capacity, self.levels[i] + elapsed * rate) - min(need, capacity)
+                if self.levels[i] < 0:
+                    wait = max(wait, -self.levels[i] / rate)
+            return wait
+
+    async def acquire(self, tokens: int):
+        wait = self._reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+limiter = RateLimiter(OPENAI_RPM, OPENAI_TPM)
+
+# httpx-клиент привязан к циклу событий, а воркеры очереди запускают свой asyncio.run
+_clients = weakref.WeakKeyDictionary()
+
+
+def _client() -> AsyncOpenAI:
+    loop = asyncio.get_running_loop()
+    if loop not in _clients:
+        # повторы SDK выключены: ими управляет _complete вместе с лимитером
+        _clients[loop] = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+    return _clients[loop]
+
+
+async def close_client():
+    """Закрывает клиент текущего цикла событий; вызывается перед выходом из asyncio.run и при остановке API."""
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.close()
+
+
+def estimate_tokens(text: str) -> int:
+    # без токенизатора: кириллица выходит примерно в 3 символа на токен
+    return len(text) // 3 + 1
+
+
+def _backoff(attempt: int, error: Exception) -> float:
+    retry_after = getattr(getattr(error, "response", None), "headers", {}).get("retry-after")
+    if retry_after:
+        try:
+            return min(float(retry_after), POLISH_BACKOFF_MAX_S)
+        except ValueError:
+            pass
+    return min(POLISH_BACKOFF_S * 2 ** attempt, POLISH_BACKOFF_MAX_S) * random.uniform(0.5, 1.0)
+
+
+async def _complete(language: str, prompt: str, expected_tokens: int, json_mode: bool = False) -> str:
+    """Один запрос chat.completions через лимитер, с повторами на 429/5xx."""
+    tokens = estimate_tokens(prompt) + expected_tokens
+    extra = {"response_format": {"type": "json_object"}} if json_mode else {}
+    for attempt in range(POLISH_MAX_RETRIES + 1):
+        await limiter.acquire(tokens)
+        try:
+            resp = await _client().chat.completions.create(
+                model=GPT_MODEL,
+                messages=[
+                    {"role": "system", "content": f"You are a helpful assistant improving {language} transcriptions."},
+                    {"role": "user",   "content": prompt}
+                ],
+                temperature=0.3,
+                max_tokens=max(2048, min(2 * expected_tokens, POLISH_MAX_OUTPUT_TOKENS)),
+                **extra
+            )
+            return resp.choices[0].message.content.strip()
+        except (RateLimitError, InternalServerError, APIConnectionError) as e:
+            if attempt == POLISH_MAX_RETRIES:
+                raise
+            delay = _backoff(attempt, e)
+            logger.warning(f"OpenAI {type(e).__name__}, retry {attempt + 1} in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+
+def _sentences(text: str) -> list[str]:
+    return [s for s in re.split(r"(?<=[.!?…])\s+", text.strip()) if s]
+
+
+def text_chunks(text: str, budget: int = None, overlap: int = None) -> list[tuple[int, str]]:
+    """
+    Делит текст на куски до budget токенов по границам предложений; предложение
+    длиннее бюджета режется по словам. Каждый кусок, кроме первого, начинается
+    с overlap последних предложений предыдущего. Возвращает пары
+    (число предложений перекрытия, текст куска).
+    """
+    budget = budget or POLISH_TEXT_CHUNK_TOKENS
+    overlap = POLISH_TEXT_OVERLAP_SENTENCES if overlap is None else overlap
+    units = []
+    for sentence in _sentences(text):
+        if estimate_tokens(sentence) <= budget:
+            units.append(sentence)
+            continue
+        words, piece = sentence.split(), []
+        for word in words:
+            if piece and estimate_tokens(" ".join(piece + [word])) > budget:
+                units.append(" ".join(piece))
+                piece = []
+            piece.append(word)
+        units.append(" ".join(piece))
+
+    chunks, current, carried = [], [], 0
+    for unit in units:
+        if current and estimate_tokens(" ".join(current + [unit])) > budget:
+            chunks.append((carried, " ".join(current)))
+            # перекрытие — только если оно заметно меньше куска
+            tail = current[-overlap:] if overlap and len(current) > overlap else []
+            if estimate_tokens(" ".join(tail)) > budget // 4:
+                tail = []
+            current, carried = list(tail), len(tail)
+        current.append(unit)
+    if current:
+        chunks.append((carried, " ".join(current)))
+    return chunks
+
+
+def _normalized(word: str) -> str:
+    return re.sub(r"\W", "", word.lower())
+
+
+def _stitch(previous: str, polished: str, overlap_sentences: int, overlap_words: int) -> str:
+    """
+    Начало полированного куска без перекрытия с предыдущим. Сначала ищется
+    самое длинное дословное совпадение конца предыдущего куска с началом
+    этого, но не длиннее перекрытия — иначе повторяющиеся фразы срезаются
+    вместе с новым текстом; если модель переписала перекрытие по-разному —
+    отбрасывается столько же предложений, сколько было в перекрытии.
+    Текст режется по позиции, так что переносы строк ответа сохраняются.
+    """
+    if not overlap_sentences:
+        return polished
+    prev_words = [_normalized(w) for w in previous.split()[-overlap_words:]] if overlap_words else []
+    spans = [m.span() for m in re.finditer(r"\S+", polished)]
+    normalized = [_normalized(polished[a:b]) for a, b in spans]
+    for n in range(min(len(prev_words), len(spans)), max(overlap_words // 2, 1) - 1, -1):
+        if prev_words[-n:] == normalized[:n]:
+            return polished[spans[n][0]:] if n < len(spans) else ""
+    text = polished.strip()
+    breaks = list(re.finditer(r"(?<=[.!?…])\s+", text))
+    return text[breaks[overlap_sentences - 1].end():] if len(breaks) >= overlap_sentences else ""
+
+
+async def _polish_chunk(text: str, language: str, prompt_template: str = None) -> str:
     # Стандартный шаблон, если не передали свой
     if not prompt_template:
         prompt_template = (
@@ -21,30 +216,59 @@ def polish_text(text: str, language: str, prompt_template: str = None) -> str:
             else "Check and correct this transcription, fix grammar and formatting: {text}"
         )
     prompt = prompt_template.format(text=text)
-    resp = _openai.chat.completions.create(
-        model=GPT_MODEL,
-        messages=[
-            {"role": "system", "content": f"You are a helpful assistant improving {language} transcriptions."},
-            {"role": "user",   "content": prompt}
-        ],
-        temperature=0.3,
-        max_tokens=2048
-    )
-    return resp.choices[0].message.content.strip()
-
-
-def polish_segments(segments: list[dict], language: str) -> list[dict]:
-    """
-    Полировка каждого сегмента с учётом реального корпуса через RAG‑поиск.
-    Возвращает список тех же сегментов с полированным текстом.
-    """
-    from .retrieval_service import get_relevant_examples
-
-    polished = []
-    for seg in segments:
-        text = seg.get('text', '')
-        # Получаем примеры из корпуса
-        examples = get_relevant_examples(text, k=3)
+    try:
+        return await _complete(language, prompt, estimate_tokens(text))
+    except Exception:
+        logger.exception("Text polishing failed, keeping raw text")
+        return text
+
+
+async def polish_text(text: str, language: str, prompt_template: str = None) -> str:
+    """
+    Полировка полноценного текста транскрипции.
+    Используется в ветке без диаризации. Длинный текст делится на куски
+    (text_chunks), которые полируются параллельно и склеиваются без
+    повторов перекрытия. Кусок, на котором OpenAI ошибся, остаётся исходным.
+    """
+    if not OPENAI_ENABLED or not text.strip():
+        return text
+    chunks = text_chunks(text)
+    semaphore = asyncio.Semaphore(POLISH_CONCURRENCY)
+
+    async def bounded(chunk):
+        async with semaphore:
+            return await _polish_chunk(chunk, language, prompt_template)
+
+    polished = await asyncio.gather(*(bounded(chunk) for _, chunk in chunks))
+    result = polished[0]
+    for (overlap, chunk), part in zip(chunks[1:], polished[1:]):
+        overlap_words = len(" ".join(_sentences(chunk)[:overlap]).split())
+        result = f"{result} {_stitch(result, part, overlap, overlap_words)}".strip()
+    return result
+
+
+async def _examples_batch(texts: list[str], k: int) -> list[list[str]]:
+    """Примеры из корпуса для всех текстов одним RAG-запросом; при ошибке — без примеров."""
+    from app.core.executors import run_io
+    from .inference import get_relevant_examples_batch
+
+    try:
+        return await run_io(get_relevant_examples_batch, texts, k=k)
+    except Exception:
+        logger.exception("Corpus example retrieval failed, polishing without examples")
+        return [[] for _ in texts]
+
+
+async def polish_segment(seg: dict, language: str, examples: list[str]) -> dict:
+    """
+    Полировка одного сегмента с учётом реального корпуса: examples — примеры
+    RAG-поиска для сегмента из _examples_batch.
+    Возвращает тот же сегмент с полированным текстом; при ошибке — с исходным.
+    """
+    text = seg.get('text', '')
+    if not OPENAI_ENABLED:
+        return {**seg, "polished_text": text}
+    try:
         block = "\n".join(f"- {ex}" for ex in examples)
 
         # Формируем промпт
@@ -55,16 +279,148 @@ def polish_segments(segments: list[dict], language: str) -> list[dict]:
             f"\"{text}\""
         )
         # Вызываем GPT для полировки сегмента
-        resp = _openai.chat.completions.create(
-            model=GPT_MODEL,
-            messages=[
-                {"role": "system", "content": f"You are a helpful assistant improving {language} transcriptions."},
-                {"role": "user",   "content": prompt}
-            ],
-            temperature=0.3,
-            max_tokens=2048
+        polished_text = await _complete(language, prompt, estimate_tokens(text))
+    except Exception:
+        logger.exception(f"Segment polishing failed at {seg.get('start')}s, keeping raw text")
+        polished_text = text
+    return {**seg, "polished_text": polished_text}
+
+
+def _packs(segments: list[dict], positions: list[int] = None) -> list[list[int]]:
+    """
+    Номера сегментов, сгруппированные подряд в пачки до POLISH_PACK_TOKENS.
+    positions — места сегментов в исходном списке: пачка не перешагивает
+    через пропущенные сегменты, чтобы модель видела только настоящих соседей.
+    """
+    packs, size = [], 0
+    for i, seg in enumerate(segments):
+        tokens = estimate_tokens(seg.get("text", ""))
+        adjacent = positions is None or positions[i] == positions[i - 1] + 1
+        if packs and adjacent and size + tokens <= POLISH_PACK_TOKENS:
+            packs[-1].append(i)
+            size += tokens
+        else:
+            packs.append([i])
+            size = tokens
+    return packs
+
+
+def _parse_pack(answer: str, count: int) -> dict[int, str]:
+    """Разбор JSON-ответа {"номер": "текст"}; неразобранные номера в результат не попадают."""
+    try:
+        data = json.loads(answer)
+    except json.JSONDecodeError:
+        return {}
+    if not isinstance(data, dict):
+        return {}
+    parsed = {}
+    for i in range(count):
+        value = data.get(str(i))
+        if isinstance(value, str):
+            parsed[i] = value.strip()
+    return parsed
+
+
+def _pack_examples(examples: list[list[str]], limit: int) -> list[str]:
+    """Общие примеры пачки: сначала лучший пример каждого сегмента, затем вторые и т. д., без повторов."""
+    merged = []
+    for rank in range(max(map(len, examples), default=0)):
+        for ex in examples:
+            if rank < len(ex) and ex[rank] not in merged:
+                merged.append(ex[rank])
+    return merged[:limit]
+
+
+async def polish_pack(segments: list[dict], language: str, examples: list[list[str]]) -> list[dict]:
+    """
+    Полировка нескольких соседних сегментов одним запросом: модель видит их
+    с метками говорящих и общие примеры из корпуса, а отвечает JSON-объектом
+    по номерам сегментов. Сегменты, которых нет в разобранном ответе,
+    отправляются повторно поодиночке и по очереди (polish_segment).
+    examples — примеры по каждому сегменту из _examples_batch.
+    """
+    if not OPENAI_ENABLED:
+        return [{**seg, "polished_text": seg.get("text", "")} for seg in segments]
+    texts = [seg.get("text", "") for seg in segments]
+    if len(segments) == 1:
+        return [await polish_segment(segments[0], language, examples[0])]
+
+    try:
+        block = "\n".join(f"- {ex}" for ex in _pack_examples(examples, POLISH_PACK_EXAMPLES))
+        lines = "\n".join(f"{i} [{seg.get('speaker', '')}]: {text}" for i, (seg, text) in enumerate(zip(segments, texts)))
+        prompt = (
+            "Вот примеры реального употребления казахского языка:\n"
+            f"{block}\n\n"
+            "Отполируйте каждый сегмент разговора ниже, сохраняя смысл и стиль. "
+            "В квадратных скобках — говорящий; соседние сегменты даны для контекста, "
+            "текст между сегментами не переносите.\n"
+            "Верните JSON-объект: ключ — номер сегмента, значение — отполированный текст.\n\n"
+            f"{lines}"
         )
-        polished_text = resp.choices[0].message.content.strip()
-        polished.append({**seg, "polished_text": polished_text})
+        parsed = _parse_pack(await _complete(language, prompt, estimate_tokens(" ".join(texts)), json_mode=True), len(segments))
+    except Exception:
+        logger.exception(f"Packed polishing failed at {segments[0].get('start')}s, keeping raw text")
+        return [{**seg, "polished_text": text} for seg, text in zip(segments, texts)]
+
+    failed = [i for i in range(len(segments)) if i not in parsed]
+    if failed:
+        logger.warning(f"Packed polishing: {len(failed)} of {len(segments)} segments not parsed, re-sending")
+        # по одному: пачка занимает один слот семафора вызывающего, и повторы в него укладываются
+        for i in failed:
+            parsed[i] = (await polish_segment(segments[i], language, examples[i]))["polished_text"]
+    return [{**seg, "polished_text": parsed[i]} for i, seg in enumerate(segments)]
+
+
+def is_confident(seg: dict) -> bool:
+    """Whisper уверен в сегменте (seg["confidence"] из transcribe_segments) — полировка не нужна."""
+    conf = seg.get("confidence")
+    if not conf:
+        return False
+    return (conf["avg_logprob"] >= POLISH_SKIP_LOGPROB
+            and conf["compression_ratio"] <= POLISH_SKIP_MAX_COMPRESSION
+            and conf["no_speech_prob"] <= POLISH_SKIP_MAX_NO_SPEECH)
+
+
+def polish_stats(segments: list[dict]) -> dict:
+    """Сколько сегментов ушло в GPT и сколько пропущено по уверенности Whisper."""
+    skipped = sum(1 for seg in segments if seg.get("polish_skipped"))
+    return {"polished": len(segments) - skipped, "skipped": skipped}
+
+
+async def polish_segments(segments: list[dict], language: str, semaphore: asyncio.Semaphore = None) -> list[dict]:
+    """
+    Полировка сегментов пачками (polish_pack) или по одному (polish_segment,
+    при POLISH_PACKED=0), до POLISH_CONCURRENCY запросов одновременно;
+    semaphore — общий лимит для нескольких одновременных вызовов.
+    Уверенные сегменты (is_confident) остаются как есть, с polish_skipped=True.
+    Возвращает список тех же сегментов с полированным текстом, в исходном порядке.
+    """
+    result = [{**seg, "polished_text": seg.get("text", ""), "polish_skipped": True} if is_confident(seg) else None
+              for seg in segments]
+    todo = [i for i, seg in enumerate(result) if seg is None]
+    pending = [segments[i] for i in todo]
+    if not pending:
+        return result
+    # примеры из корпуса для всех сегментов вызова — один запрос эмбеддингов и один поиск FAISS;
+    # в конвейере iter_transcription вызов — партия _polish_stage, в WebSocket (polish_result) — весь поток
+    examples = await _examples_batch([seg.get("text", "") for seg in pending], k=3) if OPENAI_ENABLED else [[]] * len(pending)
+    # семафор на вызов: asyncio-примитивы не переживают смену цикла событий
+    semaphore = semaphore or asyncio.Semaphore(POLISH_CONCURRENCY)
+
+    if POLISH_PACKED:
+        async def bounded(pack):
+            async with semaphore:
+                return await polish_pack([pending[i] for i in pack], language, [examples[i] for i in pack])
+
+        packs = await asyncio.gather(*(bounded(pack) for pack in _packs(pending, todo)))
+        polished = [seg for pack in packs for seg in pack]
+    else:
+        async def bounded(seg, seg_examples):
+            async with semaphore:
+                return await polish_segment(seg, language, seg_examples)
+
+        polished = await asyncio.gather(*(bounded(seg, ex) for seg, ex in zip(pending, examples)))
 
-    return polished
+    for i, seg in zip(todo, polished):
+        result[i] = seg
+    return result
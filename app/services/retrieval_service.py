@@ -20,18 +20,55 @@ with open(SENT_FILE, encoding="utf-8") as f:
 # 3. Инициализируем OpenAI клиент
 client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
-def get_relevant_examples(text: str, k: int = 3) -> list[str]:
+# ограничения одного запроса embeddings: до 2048 строк и ~300k токенов на запрос
+EMBED_BATCH_INPUTS = int(os.getenv("EMBED_BATCH_INPUTS", "2048"))
+EMBED_BATCH_TOKENS = int(os.getenv("EMBED_BATCH_TOKENS", "250000"))
+
+
+def _embedding_batches(texts: list[str]) -> list[list[str]]:
+    # токены оцениваются грубо, ~3 символа кириллицы на токен
+    batches, size = [], 0
+    for text in texts:
+        tokens = len(text) // 3 + 1
+        if batches and len(batches[-1]) < EMBED_BATCH_INPUTS and size + tokens <= EMBED_BATCH_TOKENS:
+            batches[-1].append(text)
+            size += tokens
+        else:
+            batches.append([text])
+            size = tokens
+    return batches
+
+
+def get_relevant_examples_batch(texts: list[str], k: int = 3) -> list[list[str]]:
     """
-    Возвращает k наиболее релевантных предложений из корпуса.
+    k наиболее релевантных предложений корпуса для каждого текста:
+    эмбеддинги одним запросом (или несколькими, если не влезают в лимиты API)
+    и один поиск FAISS по всей матрице. Для пустых текстов — пустой список.
     """
-    # 3.1 Запрос эмбеддинга
-    resp = client.embeddings.create(
-        model="text-embedding-3-small",     # дешевле; 1536‑д
-        input=[text]                         # единичный элемент
-    )
-    emb = resp.data[0].embedding            # 
+    queries = [i for i, text in enumerate(texts) if text.strip()]
+    results = [[] for _ in texts]
+    if not queries:
+        return results
+
+    # 3.1 Запрос эмбеддингов
+    embeddings = []
+    for batch in _embedding_batches([texts[i] for i in queries]):
+        resp = client.embeddings.create(
+            model="text-embedding-3-small",     # дешевле; 1536‑д
+            input=batch
+        )
+        embeddings.extend(item.embedding for item in sorted(resp.data, key=lambda item: item.index))
 
     # 3.2 Поиск в FAISS
-    D, I = INDEX.search(np.array([emb], dtype="float32"), k)  # :contentReference[oaicite:1]{index=1}
+    D, I = INDEX.search(np.array(embeddings, dtype="float32"), k)  # :contentReference[oaicite:1]{index=1}
 
-    return [SENTENCES[i] for i in I[0]]
+    for i, row in zip(queries, I):
+        results[i] = [SENTENCES[j] for j in row if j >= 0]
+    return results
+
+
+def get_relevant_examples(text: str, k: int = 3) -> list[str]:
+    """
+    Возвращает k наиболее релевантных предложений из корпуса.
+    """
+    return get_relevant_examples_batch([text], k)[0]
@@ -6,6 +6,7 @@ from fastapi import UploadFile
 import logging
 from dotenv import load_dotenv
 from botocore.client import Config
+from app.core.executors import run_io
 
 load_dotenv()
 logger = logging.getLogger(__name__)
@@ -45,15 +46,17 @@ class S3StorageService:
             file_extension = os.path.splitext(file.filename)[1]
             unique_filename = f"{uuid.uuid4()}{file_extension}"
 
+            # в S3 уходит сам файл загрузки частями (multipart для больших),
+            # без чтения записи целиком в память
+            file_size = file.file.seek(0, os.SEEK_END)
             await file.seek(0)
-            file_content = await file.read()
-            file_size = len(file_content)
 
-            self.s3_client.put_object(
-                Bucket=self.bucket_name,
-                Key=unique_filename,
-                Body=file_content,
-                ContentType=file.content_type
+            await run_io(
+                self.s3_client.upload_fileobj,
+                file.file,
+                self.bucket_name,
+                unique_filename,
+                ExtraArgs={"ContentType": file.content_type}
             )
 
             # Construct file URL
@@ -70,4 +73,33 @@ class S3StorageService:
             logger.error(f"S3 upload error: {str(e)}")
             raise
 
+    async def upload_bytes(self, content: bytes, filename: str, content_type: str) -> dict:
+        """Загрузка уже собранных в памяти данных (например, записи из WebSocket-потока)."""
+        try:
+            unique_filename = f"{uuid.uuid4()}{os.path.splitext(filename)[1]}"
+            await run_io(
+                self.s3_client.put_object,
+                Bucket=self.bucket_name,
+                Key=unique_filename,
+                Body=content,
+                ContentType=content_type
+            )
+            return {
+                "original_filename": filename,
+                "s3_filename": unique_filename,
+                "s3_url": f"{self.endpoint_url}/{self.bucket_name}/{unique_filename}",
+                "size": len(content)
+            }
+        except Exception as e:
+            logger.error(f"S3 upload error: {str(e)}")
+            raise
+
+    def download_file(self, s3_filename: str, path: str):
+        """Скачивает объект по ключу в локальный файл (для воркеров очереди)."""
+        try:
+            self.s3_client.download_file(self.bucket_name, s3_filename, path)
+        except Exception as e:
+            logger.error(f"S3 download error: {str(e)}")
+            raise
+
 storage_service = S3StorageService()
\ No newline at end of file
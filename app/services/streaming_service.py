@@ -0,0 +1,192 @@
+# app/services/streaming_service.py
+import io
+import os
+import wave
+from typing import Optional
+
+import numpy as np
+import soxr
+
+from app.services.audio_service import SAMPLE_RATE, AudioBuffer
+from app.services.inference import transcribe_segments, run_scheduled
+
+# как часто перераспознавать незафиксированный хвост потока
+STREAM_STEP_S = float(os.getenv("STREAM_STEP_S", "1.0"))
+# максимальная длина незафиксированного окна; дальше сегмент режется принудительно
+STREAM_WINDOW_S = float(os.getenv("STREAM_WINDOW_S", "15"))
+# сегмент фиксируется на паузе не короче STREAM_PAUSE_S, но не раньше STREAM_MIN_SEGMENT_S
+STREAM_PAUSE_S = float(os.getenv("STREAM_PAUSE_S", "0.6"))
+STREAM_MIN_SEGMENT_S = float(os.getenv("STREAM_MIN_SEGMENT_S", "2.0"))
+
+_FRAME = int(0.02 * SAMPLE_RATE)
+
+
+class PcmDecoder:
+    """
+    Декодер аудио WebSocket-потока: bytes сообщения -> float32 16 кГц моно.
+    pcm_s16le / pcm_f32le — сырые отсчёты (отсчёт может разрываться между
+    сообщениями), opus — отдельные Opus-пакеты (нужен opuslib).
+    Другая частота пересэмплируется одним потоковым ресэмплером soxr на весь
+    поток, без стыков на границах сообщений. Битые данные — ValueError.
+    """
+
+    def __init__(self, fmt: str, sample_rate: int):
+        if sample_rate <= 0:
+            raise ValueError(f"Invalid sample rate: {sample_rate}")
+        self._opus = None
+        self._rest = b""
+        if fmt == "pcm_s16le":
+            self._dtype = np.dtype("<i2")
+        elif fmt == "pcm_f32le":
+            self._dtype = np.dtype("<f4")
+        elif fmt == "opus":
+            import opuslib  # необязательная зависимость, нужна только для Opus
+
+            try:
+                self._opus = opuslib.Decoder(sample_rate, 1)
+            except opuslib.OpusError as e:
+                raise ValueError(f"Unsupported Opus sample rate {sample_rate}: {e}") from e
+            self._opus_error = opuslib.OpusError
+            # максимальная длительность Opus-пакета — 120 мс
+            self._frame_size = sample_rate * 120 // 1000
+        else:
+            raise ValueError(f"Unsupported stream format: {fmt}")
+        self._resampler = (soxr.ResampleStream(sample_rate, SAMPLE_RATE, 1, dtype="float32")
+                           if sample_rate != SAMPLE_RATE else None)
+
+    def _to_float(self, data: bytes) -> np.ndarray:
+        if self._opus is not None:
+            try:
+                pcm = self._opus.decode(data, self._frame_size)
+            except self._opus_error as e:
+                raise ValueError(f"Bad Opus packet: {e}") from e
+            return np.frombuffer(pcm, dtype="<i2").astype(np.float32) / 32768.0
+        # неполный отсчёт в конце сообщения ждёт продолжения в следующем
+        data = self._rest + data
+        usable = len(data) - len(data) % self._dtype.itemsize
+        self._rest = data[usable:]
+        samples = np.frombuffer(data[:usable], dtype=self._dtype).astype(np.float32)
+        return samples / 32768.0 if self._dtype.kind == "i" else samples
+
+    def __call__(self, data: bytes) -> np.ndarray:
+        samples = self._to_float(data)
+        return self._resampler.resample_chunk(samples) if self._resampler else samples
+
+    def flush(self) -> np.ndarray:
+        """Конец потока: хвост, задержанный ресэмплером."""
+        if not self._resampler:
+            return np.zeros(0, dtype=np.float32)
+        return self._resampler.resample_chunk(np.zeros(0, dtype=np.float32), last=True)
+
+
+def _frame_rms(samples: np.ndarray) -> np.ndarray:
+    frames = len(samples) // _FRAME
+    return np.sqrt(np.mean(samples[:frames * _FRAME].reshape(frames, _FRAME) ** 2, axis=1))
+
+
+def _silent(rms: np.ndarray) -> np.ndarray:
+    # тишина — на ~26 дБ ниже громких кадров окна (или почти нулевой сигнал)
+    return rms < max(1e-3, np.percentile(rms, 95) * 0.05)
+
+
+class StreamingTranscriber:
+    """
+    Распознавание потока скользящим окном.
+    Незафиксированный хвост перераспознаётся каждые STREAM_STEP_S секунд
+    (соседние окна перекрываются) — это partial-результаты. Хвост фиксируется
+    в final-сегмент на паузе или, без паузы, в самой тихой точке, когда окно
+    дорастает до STREAM_WINDOW_S.
+    """
+
+    def __init__(self, task: str = "transcribe"):
+        self.task = task
+        self.pending = np.zeros(0, dtype=np.float32)
+        self.offset = 0.0  # начало pending на шкале потока, с
+        self.chunks = []
+        self.segments = []
+        self._since_decode = 0
+
+    @property
+    def duration(self) -> float:
+        return self.offset + len(self.pending) / SAMPLE_RATE
+
+    async def _decode(self, samples: np.ndarray, task: str):
+        audio = AudioBuffer(samples)
+        texts = await run_scheduled(transcribe_segments, audio, [(0.0, audio.duration)], task=task)
+        return texts[0]
+
+    def _find_cut(self) -> Optional[int]:
+        if len(self.pending) < STREAM_MIN_SEGMENT_S * SAMPLE_RATE:
+            return None
+        rms = _frame_rms(self.pending)
+        silent = _silent(rms)
+        pause = int(STREAM_PAUSE_S / 0.02)
+        # кадры i, с которых начинается пауза длиной pause кадров
+        starts = np.flatnonzero(np.convolve(silent, np.ones(pause, dtype=int), "valid") == pause)
+        starts = starts[starts * _FRAME >= STREAM_MIN_SEGMENT_S * SAMPLE_RATE]
+        if len(starts):
+            return int(starts[-1] + pause // 2) * _FRAME
+        if len(self.pending) >= STREAM_WINDOW_S * SAMPLE_RATE:
+            lo = len(rms) * 2 // 3
+            return int(lo + np.argmin(rms[lo:])) * _FRAME
+        return None
+
+    async def _finalize(self, cut: int) -> Optional[dict]:
+        samples, self.pending = self.pending[:cut], self.pending[cut:]
+        start, self.offset = self.offset, self.offset + cut / SAMPLE_RATE
+        rms = _frame_rms(samples)
+        # сегмент из одной тишины не распознаём, чтобы Whisper не галлюцинировал
+        if not len(rms) or rms.max() < 1e-3:
+            return None
+        output = await self._decode(samples, self.task)
+        # task="both": (текст, перевод)
+        text, translation = output if isinstance(output, tuple) else (output, None)
+        if not text:
+            return None
+        segment = {"start": round(start, 2), "end": round(self.offset, 2), "text": text}
+        if translation is not None:
+            segment["translation"] = translation
+        self.segments.append(segment)
+        return {"type": "final", **segment}
+
+    async def feed(self, samples: np.ndarray) -> list[dict]:
+        """Добавляет аудио и, если пора, возвращает события final/partial."""
+        self.chunks.append(samples)
+        self.pending = np.concatenate([self.pending, samples])
+        self._since_decode += len(samples)
+        if self._since_decode < STREAM_STEP_S * SAMPLE_RATE:
+            return []
+        self._since_decode = 0
+
+        events = []
+        cut = self._find_cut()
+        if cut:
+            final = await self._finalize(cut)
+            if final:
+                events.append(final)
+        if len(self.pending) >= _FRAME * 15 and _frame_rms(self.pending).max() >= 1e-3:
+            # для partial перевод не нужен, он придёт с final
+            text = await self._decode(self.pending, "transcribe" if self.task == "both" else self.task)
+            if text:
+                events.append({"type": "partial", "start": round(self.offset, 2),
+                               "end": round(self.duration, 2), "text": text})
+        return events
+
+    async def finish(self) -> list[dict]:
+        """Конец потока: фиксирует остаток."""
+        final = await self._finalize(len(self.pending)) if len(self.pending) else None
+        return [final] if final else []
+
+    def audio(self) -> AudioBuffer:
+        return AudioBuffer(np.concatenate(self.chunks) if self.chunks else np.zeros(0, dtype=np.float32))
+
+    def wav_bytes(self) -> bytes:
+        """Вся запись потока в WAV 16 бит для сохранения в S3."""
+        pcm = (np.clip(self.audio().waveform, -1.0, 1.0) * 32767).astype("<i2")
+        out = io.BytesIO()
+        with wave.open(out, "wb") as w:
+            w.setnchannels(1)
+            w.setsampwidth(2)
+            w.setframerate(SAMPLE_RATE)
+            w.writeframes(pcm.tobytes())
+        return out.getvalue()
@@ -0,0 +1,349 @@
+# app/services/transcription_service.py
+import asyncio
+import math
+import os
+from collections import defaultdict
+from contextlib import aclosing
+from typing import AsyncIterator
+from sqlalchemy.orm import Session
+from app.core.executors import run_cpu, run_io
+from app.models.audio_model import AudioTranscription
+from app.services.audio_service import AudioBuffer, as_audio_buffer, decode_to_cache
+from app.services.inference import diarize_file, transcribe_full, transcribe_segments, detect_emotions, run_scheduled
+from app.services.polishing_service import (
+    OPENAI_ENABLED, POLISH_CONCURRENCY, POLISH_PACK_TOKENS, estimate_tokens, is_confident,
+    polish_segments, polish_stats, polish_text
+)
+from app.services.vad_service import VAD_ENABLED, restrict_to_speech, speech_regions, speech_windows
+
+# длина окна эмоций для записи без диаризации, чтобы не гонять wav2vec2 по всему файлу разом
+EMOTION_WINDOW_S = float(os.getenv("EMOTION_WINDOW_S", "30"))
+# сегментов диаризации на один вызов пула в конвейере iter_transcription
+PROGRESS_CHUNK_SEGMENTS = int(os.getenv("PROGRESS_CHUNK_SEGMENTS", "8"))
+# глубина очередей между стадиями конвейера; ограничивает память и забегание вперёд
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "4"))
+# стадия полировки копит сегменты в партии на столько пачек по POLISH_PACK_TOKENS:
+# одна партия — один поиск примеров в корпусе, её пачки полируются параллельно
+POLISH_STAGE_PACKS = int(os.getenv("POLISH_STAGE_PACKS", "2"))
+# партий в полировке одновременно; запросов у них общий лимит POLISH_CONCURRENCY
+POLISH_STAGE_IN_FLIGHT = max(1, POLISH_CONCURRENCY // POLISH_STAGE_PACKS)
+# партия уходит раньше бюджета, если набрала столько сегментов или ждёт дольше стольких секунд:
+# сегменты SSE не должны копиться до конца записи
+POLISH_STAGE_MAX_SEGMENTS = int(os.getenv("POLISH_STAGE_MAX_SEGMENTS", "32"))
+POLISH_STAGE_MAX_WAIT_S = float(os.getenv("POLISH_STAGE_MAX_WAIT_S", "1"))
+
+
+def aggregate_emotion(segments: list[dict]) -> str:
+    """Общая эмоция записи: метка с наибольшей суммарной длительностью сегментов."""
+    weights = defaultdict(float)
+    for seg in segments:
+        if seg.get("emotion"):
+            weights[seg["emotion"]] += seg["end"] - seg["start"]
+    return max(weights, key=weights.get) if weights else ""
+
+
+def _with_output(segment: dict, output, confidence: dict = None) -> dict:
+    """
+    Выход Whisper для сегмента: текст или, при task="both", пара (текст, перевод);
+    confidence — уверенность Whisper, по ней полировка пропускает надёжные сегменты.
+    """
+    if confidence is not None:
+        segment = {**segment, "confidence": confidence}
+    if isinstance(output, tuple):
+        return {**segment, "text": output[0], "translation": output[1]}
+    return {**segment, "text": output}
+
+
+def _translation(segments: list[dict]) -> str | None:
+    """Перевод всей записи для task="both", иначе None."""
+    if not any("translation" in s for s in segments):
+        return None
+    return " ".join(s["translation"] for s in segments if s.get("translation"))
+
+
+def _fixed_windows(duration: float, length: float) -> list[tuple[float, float]]:
+    return [(i * length, min((i + 1) * length, duration)) for i in range(math.ceil(duration / length))]
+
+
+def speech_segments(audio: AudioBuffer) -> list[dict]:
+    """Сегменты диаризации без тишины и музыки: Whisper получает только речь."""
+    raw = diarize_file(audio)
+    if VAD_ENABLED:
+        raw = restrict_to_speech(raw, speech_regions(audio))
+    return raw
+
+
+def analyze_audio(audio: str | AudioBuffer, task: str = "transcribe") -> dict:
+    """
+    Вычислительная часть конвейера без диаризации: транскрипция → эмоции.
+    Файл декодируется один раз, дальше все модели работают с одним буфером.
+    """
+    audio = as_audio_buffer(audio)
+    if VAD_ENABLED:
+        # только регионы речи, упакованные в окна Whisper по 30 с
+        windows = speech_windows(audio)
+        parts = [_with_output({}, out) for out in transcribe_segments(audio, windows, task=task)]
+    else:
+        windows = _fixed_windows(audio.duration, EMOTION_WINDOW_S)
+        parts = [_with_output({}, transcribe_full(audio, task=task))]
+    full_text = " ".join(p["text"] for p in parts if p["text"])
+    emotions = detect_emotions(audio, windows)
+    return {
+        "text": full_text,
+        "formatted_text": full_text,
+        "segments": [],
+        "speakers": [],
+        "overall_emotion": aggregate_emotion(
+            [{"start": st, "end": ed, "emotion": emo} for (st, ed), emo in zip(windows, emotions)]
+        ),
+        "duration": audio.duration,
+        "translation": _translation(parts),
+    }
+
+
+# конец потока в очередях конвейера
+_DONE = object()
+
+
+async def _stage(inbox: asyncio.Queue, outbox: asyncio.Queue, fn):
+    """
+    Стадия конвейера: fn(item) -> список результатов, элементы по порядку.
+    Исключение уходит дальше вместо результата, чтобы потребитель не ждал вечно.
+    """
+    try:
+        while (item := await inbox.get()) is not _DONE:
+            if isinstance(item, Exception):
+                await outbox.put(item)
+                return
+            for out in await fn(item):
+                await outbox.put(out)
+    except Exception as e:
+        await outbox.put(e)
+        return
+    await outbox.put(_DONE)
+
+
+async def _polish_stage(inbox: asyncio.Queue, outbox: asyncio.Queue, language: str):
+    """
+    Стадия полировки: списки сегментов из inbox копятся в партию, пока текст
+    сегментов для GPT (без уверенных) не наберёт POLISH_STAGE_PACKS пачек,
+    партия не наберёт POLISH_STAGE_MAX_SEGMENTS сегментов или первый её сегмент
+    не прождёт POLISH_STAGE_MAX_WAIT_S. Партия только из уверенных сегментов
+    уходит сразу: полировать в ней нечего.
+    Партия уходит в polish_segments отдельной задачей, до POLISH_STAGE_IN_FLIGHT
+    партий одновременно с общим семафором запросов; готовые партии выходят
+    в outbox по порядку, не дожидаясь следующих.
+    Без OpenAI полировать нечего, и сегменты идут дальше без накопления.
+    """
+    budget = POLISH_STAGE_PACKS * POLISH_PACK_TOKENS if OPENAI_ENABLED else 0
+    semaphore = asyncio.Semaphore(POLISH_CONCURRENCY)
+    # задачи партий по порядку; размер очереди ограничивает партии в работе
+    batches = asyncio.Queue(POLISH_STAGE_IN_FLIGHT)
+    loop = asyncio.get_running_loop()
+
+    async def read(tg: asyncio.TaskGroup):
+        batch, size, deadline = [], 0, None
+
+        async def flush():
+            nonlocal batch, size, deadline
+            await batches.put(tg.create_task(polish_segments(batch, language, semaphore)))
+            batch, size, deadline = [], 0, None
+
+        while True:
+            try:
+                # отмена get по таймауту не теряет элемент: он остаётся в очереди
+                timeout = None if deadline is None else max(0.0, deadline - loop.time())
+                item = await asyncio.wait_for(inbox.get(), timeout)
+            except TimeoutError:
+                await flush()
+                continue
+            if item is _DONE:
+                break
+            if isinstance(item, Exception):
+                raise item
+            batch += item
+            size += sum(estimate_tokens(seg["text"]) for seg in item if not is_confident(seg))
+            if deadline is None:
+                deadline = loop.time() + POLISH_STAGE_MAX_WAIT_S
+            if size == 0 or size >= budget or len(batch) >= POLISH_STAGE_MAX_SEGMENTS:
+                await flush()
+        if batch:
+            await flush()
+        await batches.put(_DONE)
+
+    async def emit():
+        while (task := await batches.get()) is not _DONE:
+            for seg in await task:
+                await outbox.put(seg)
+
+    try:
+        async with asyncio.TaskGroup() as tg:
+            tg.create_task(read(tg))
+            tg.create_task(emit())
+    except ExceptionGroup as group:
+        await outbox.put(group.exceptions[0])
+        return
+    await outbox.put(_DONE)
+
+
+async def iter_transcription(
+    audio_path: str,
+    language: str = "kk",
+    task: str = "transcribe",
+    enable_diarization: bool = True
+) -> AsyncIterator[tuple[str, dict]]:
+    """
+    Транскрипция файла конвейером: ("diarization", {...}) сразу после диаризации,
+    ("segment", seg) для каждого готового (с эмоцией и полировкой) сегмента
+    по порядку и ("result", result) в конце.
+
+    После диаризации стадии Whisper → эмоции → полировка работают одновременно:
+    Whisper и эмоции идут пачками по PROGRESS_CHUNK_SEGMENTS сегментов, полировка —
+    своими партиями по токенам (_polish_stage). Пока партия полируется по сети
+    (пачки — параллельно), следующие сегменты декодируются в пуле инференса.
+    Между стадиями — очереди на PIPELINE_QUEUE_SIZE элементов.
+    """
+    audio = await run_io(decode_to_cache, audio_path)
+    try:
+        async for event in _iter_decoded(audio, language, task, enable_diarization):
+            yield event
+    finally:
+        # PCM-кэш удаляется и при ошибке любой стадии, и при обрыве клиента
+        audio.delete_cache()
+
+
+async def _iter_decoded(
+    audio: AudioBuffer,
+    language: str,
+    task: str,
+    enable_diarization: bool
+) -> AsyncIterator[tuple[str, dict]]:
+    if not enable_diarization:
+        result = await run_cpu(analyze_audio, audio, task)
+        yield "result", await polish_result(result, language, False)
+        return
+
+    raw = await run_cpu(speech_segments, audio)
+    speakers = list(dict.fromkeys(s["speaker"] for s in raw))
+    yield "diarization", {"segments": raw, "speakers": speakers, "duration": audio.duration}
+
+    async def transcribe(chunk):
+        # в пул уходит только фрагмент записи под пачкой, а не весь файл
+        offset = chunk[0]["start"]
+        excerpt = audio.excerpt(offset, max(s["end"] for s in chunk))
+        windows = [(s["start"] - offset, s["end"] - offset) for s in chunk]
+        texts, confidences = await run_scheduled(transcribe_segments, excerpt, windows, task=task, with_confidence=True)
+        return [(chunk, excerpt, windows, texts, confidences)]
+
+    async def emotions(item):
+        chunk, excerpt, windows, texts, confidences = item
+        labels = await run_cpu(detect_emotions, excerpt, windows)
+        return [[
+            _with_output({"start": s["start"], "end": s["end"], "speaker": s["speaker"], "emotion": emo}, txt, conf)
+            for s, txt, conf, emo in zip(chunk, texts, confidences, labels)
+        ]]
+
+    chunks, decoded, analyzed, polished = (asyncio.Queue(PIPELINE_QUEUE_SIZE) for _ in range(4))
+    stages = [
+        asyncio.create_task(_stage(chunks, decoded, transcribe)),
+        asyncio.create_task(_stage(decoded, analyzed, emotions)),
+        asyncio.create_task(_polish_stage(analyzed, polished, language)),
+    ]
+
+    async def feed():
+        for i in range(0, len(raw), PROGRESS_CHUNK_SEGMENTS):
+            await chunks.put(raw[i:i + PROGRESS_CHUNK_SEGMENTS])
+        await chunks.put(_DONE)
+
+    stages.append(asyncio.create_task(feed()))
+    segments = []
+    try:
+        while (seg := await polished.get()) is not _DONE:
+            if isinstance(seg, Exception):
+                raise seg
+            segments.append(seg)
+            yield "segment", seg
+    finally:
+        for stage in stages:
+            stage.cancel()
+
+    text = " ".join(s["text"] for s in segments)
+    yield "result", {
+        "text": text,
+        "formatted_text": "\n".join(f"{s['speaker']}: {s['text']}" for s in segments),
+        "segments": segments,
+        "speakers": speakers,
+        "overall_emotion": aggregate_emotion(segments),
+        "duration": audio.duration,
+        "translation": _translation(segments),
+        "polished_text": " ".join(s["polished_text"] for s in segments),
+        "polish_stats": polish_stats(segments),
+    }
+
+
+async def transcribe_pipeline(
+    audio_path: str,
+    language: str = "kk",
+    task: str = "transcribe",
+    enable_diarization: bool = True
+) -> dict:
+    """Итоговый результат конвейера iter_transcription одним вызовом."""
+    # aclosing: выход из цикла сразу закрывает генератор, и PCM-кэш удаляется здесь же
+    async with aclosing(iter_transcription(audio_path, language, task, enable_diarization)) as events:
+        async for event, data in events:
+            if event == "result":
+                return data
+
+
+def stream_result(audio: AudioBuffer, segments: list[dict]) -> dict:
+    """
+    Итог WebSocket-потока: final-сегменты уже распознаны, остаётся
+    посчитать эмоции по всей записи одним батчем.
+    """
+    emotions = detect_emotions(audio, [(s["start"], s["end"]) for s in segments])
+    segments_data = [{**s, "speaker": "SPEAKER_00", "emotion": emo} for s, emo in zip(segments, emotions)]
+    full_text = " ".join(s["text"] for s in segments_data)
+    return {
+        "text": full_text,
+        "formatted_text": full_text,
+        "segments": segments_data,
+        "speakers": ["SPEAKER_00"] if segments_data else [],
+        "overall_emotion": aggregate_emotion(segments_data),
+        "duration": audio.duration,
+        "translation": _translation(segments_data),
+    }
+
+
+async def polish_result(result: dict, language: str = "kk", enable_diarization: bool = True) -> dict:
+    """Сетевая часть конвейера: GPT-полировка по сегментам или всего текста."""
+    if enable_diarization:
+        segments = await polish_segments(result["segments"], language)
+        return {**result, "segments": segments, "polished_text": " ".join(s['polished_text'] for s in segments),
+                "polish_stats": polish_stats(segments)}
+    return {**result, "polished_text": await polish_text(result["text"], language)}
+
+
+def build_transcription(file_info: dict, result: dict, language: str) -> AudioTranscription:
+    return AudioTranscription(
+        original_filename       = file_info["original_filename"],
+        s3_filename             = file_info["s3_filename"],
+        s3_url                  = file_info["s3_url"],
+        file_size               = file_info["size"],
+        duration                = result["duration"],
+        language                = language,
+        transcription           = result["text"],
+        formatted_transcription = result["formatted_text"],
+        speakers                = result["speakers"],
+        diarization_data        = result["segments"],
+        overall_emotion         = result["overall_emotion"],
+        polished_text           = result["polished_text"],
+        translation             = result.get("translation")
+    )
+
+
+def save_transcription(db: Session, file_info: dict, result: dict, language: str) -> AudioTranscription:
+    transcription = build_transcription(file_info, result, language)
+    db.add(transcription)
+    db.commit()
+    db.refresh(transcription)
+    return transcription
@@ -0,0 +1,160 @@
+# app/services/vad_service.py
+"""
+Детектор речи без моделей: энергия кадра относительно шумового пола,
+доля энергии в речевой полосе, спектральная плоскостность и частота
+слоговых пиков энергии (речь модулирована с частотой 3–6 Гц), посчитанные
+векторно по блокам записи. Отрезает тишину, шум, гул, непрерывные гудки
+и выдержанные аккорды; прерывистые гудки и ритмичная музыка модулированы
+как речь и могут пройти. Время регионов — на шкале исходной записи.
+"""
+import os
+
+import numpy as np
+
+from app.services.audio_service import AudioBuffer
+
+VAD_ENABLED = os.getenv("VAD_ENABLED", "1") == "1"
+# порог над шумовым полом записи (10-й перцентиль энергии кадров), дБ
+VAD_ENERGY_DB = float(os.getenv("VAD_ENERGY_DB", "12"))
+# кадр тише этого уровня — тишина при любом шумовом поле, дБFS
+VAD_FLOOR_DBFS = float(os.getenv("VAD_FLOOR_DBFS", "-55"))
+# доля энергии в речевой полосе 200–4000 Гц, ниже — гул сети и рокот, а не голос
+VAD_BAND_RATIO = float(os.getenv("VAD_BAND_RATIO", "0.2"))
+# плоскостность спектра выше — белый шум
+VAD_MAX_FLATNESS = float(os.getenv("VAD_MAX_FLATNESS", "0.45"))
+# слоговых пиков энергии в секунду вокруг кадра: у речи 3–6, у гудка и аккорда ни одного
+VAD_MIN_SYLLABLE_RATE = float(os.getenv("VAD_MIN_SYLLABLE_RATE", "1.5"))
+# на сколько пик должен подниматься над провалами по обе стороны (200 мс), дБ
+VAD_SYLLABLE_DB = float(os.getenv("VAD_SYLLABLE_DB", "6"))
+VAD_MIN_SPEECH_S = float(os.getenv("VAD_MIN_SPEECH_S", "0.25"))
+VAD_MIN_SILENCE_S = float(os.getenv("VAD_MIN_SILENCE_S", "0.5"))
+VAD_PAD_S = float(os.getenv("VAD_PAD_S", "0.15"))
+# паузы длиннее не склеиваются в одно окно Whisper
+VAD_MAX_GAP_S = float(os.getenv("VAD_MAX_GAP_S", "2.0"))
+
+FRAME = 512  # 32 мс при 16 кГц
+HOP = 320  # 20 мс
+BLOCK_FRAMES = 3000  # кадров на блок, чтобы не держать в памяти спектр всей записи
+
+
+def frame_features(audio: AudioBuffer) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Энергия (дБFS), доля речевой полосы и плоскостность спектра для каждого кадра HOP."""
+    x = audio.waveform
+    n_frames = max(0, 1 + (len(x) - FRAME) // HOP)
+    freqs = np.fft.rfftfreq(FRAME, 1 / audio.sample_rate)
+    band = (freqs >= 200) & (freqs <= 4000)
+    window = np.hanning(FRAME).astype(np.float32)
+
+    energy = np.empty(n_frames, dtype=np.float32)
+    ratio = np.empty(n_frames, dtype=np.float32)
+    flatness = np.empty(n_frames, dtype=np.float32)
+    for b in range(0, n_frames, BLOCK_FRAMES):
+        count = min(BLOCK_FRAMES, n_frames - b)
+        frames = np.lib.stride_tricks.as_strided(
+            x[b * HOP:], shape=(count, FRAME), strides=(HOP * x.strides[0], x.strides[0])
+        )
+        power = np.abs(np.fft.rfft(frames * window, axis=1)) ** 2 + 1e-12
+        total = power.sum(axis=1)
+        energy[b:b + count] = 10 * np.log10(np.mean(frames ** 2, axis=1) + 1e-12)
+        ratio[b:b + count] = power[:, band].sum(axis=1) / total
+        flatness[b:b + count] = np.exp(np.mean(np.log(power), axis=1)) / np.mean(power, axis=1)
+    return energy, ratio, flatness
+
+
+def _runs(mask: np.ndarray) -> np.ndarray:
+    """Пары [начало, конец) кадров для непрерывных участков True."""
+    edges = np.diff(np.concatenate([[0], mask.astype(np.int8), [0]]))
+    return np.stack([np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)], axis=1)
+
+
+def syllable_rate(energy: np.ndarray, hop_s: float) -> np.ndarray:
+    """Слоговых пиков энергии в секунду в окне 1 с вокруг каждого кадра."""
+    k = max(1, int(round(0.2 / hop_s)))
+    e = np.convolve(np.pad(energy, 1, mode="edge"), np.ones(3) / 3, "valid")
+    padded = np.pad(e, k, mode="edge")
+    win = np.lib.stride_tricks.sliding_window_view(padded, 2 * k + 1)
+    # пик — первый кадр максимума окна, заметно выше провалов слева и справа;
+    # у ровного тона и на фронте включения такого провала с одной из сторон нет
+    dips = np.maximum(win[:, :k].min(axis=1), win[:, k + 1:].min(axis=1))
+    peaks = (e >= win.max(axis=1)) & (e > padded[k - 1:k - 1 + len(e)]) & (e - dips >= VAD_SYLLABLE_DB)
+    n = max(1, int(round(1.0 / hop_s)))
+    return np.convolve(peaks.astype(np.float32), np.ones(n, dtype=np.float32), "same") / (n * hop_s)
+
+
+def speech_mask(audio: AudioBuffer) -> np.ndarray:
+    energy, ratio, flatness = frame_features(audio)
+    if not len(energy):
+        return np.zeros(0, dtype=bool)
+    floor = np.percentile(energy, 10)
+    # провалы ниже шумового пола не делают пики выше
+    rate = syllable_rate(np.maximum(energy, floor), HOP / audio.sample_rate)
+    mask = (energy > max(floor + VAD_ENERGY_DB, VAD_FLOOR_DBFS)) \
+        & (ratio > VAD_BAND_RATIO) & (flatness < VAD_MAX_FLATNESS) & (rate >= VAD_MIN_SYLLABLE_RATE)
+    # сглаживание большинством по 5 кадрам убирает одиночные щелчки и провалы
+    return np.convolve(mask, np.ones(5, dtype=int), "same") >= 3
+
+
+def speech_regions(audio: AudioBuffer) -> list[tuple[float, float]]:
+    """Регионы речи (с, на шкале записи), паузы короче VAD_MIN_SILENCE_S не разрывают регион."""
+    mask = speech_mask(audio)
+    hop_s = HOP / audio.sample_rate
+    # короткие паузы внутри речи закрашиваем, короткие всплески выбрасываем
+    for start, end in _runs(~mask):
+        if 0 < start and end < len(mask) and (end - start) * hop_s < VAD_MIN_SILENCE_S:
+            mask[start:end] = True
+    regions = []
+    for start, end in _runs(mask):
+        if (end - start) * hop_s < VAD_MIN_SPEECH_S:
+            continue
+        st = max(start * hop_s - VAD_PAD_S, 0.0)
+        ed = min((end - 1) * hop_s + FRAME / audio.sample_rate + VAD_PAD_S, audio.duration)
+        if regions and st <= regions[-1][1]:
+            regions[-1] = (regions[-1][0], ed)
+        else:
+            regions.append((st, ed))
+    return [(round(float(st), 2), round(float(ed), 2)) for st, ed in regions]
+
+
+def speech_windows(audio: AudioBuffer, max_len: float = 30.0) -> list[tuple[float, float]]:
+    """
+    Регионы речи, упакованные в окна Whisper не длиннее max_len.
+    Соседние регионы объединяются, пока помещаются в окно и пауза между
+    ними не длиннее VAD_MAX_GAP_S; регион длиннее окна режется в самой
+    тихой точке последних 5 с окна.
+    """
+    energy = None
+    windows = []
+    for st, ed in speech_regions(audio):
+        while ed - st > max_len:
+            if energy is None:
+                energy = frame_features(audio)[0]
+            hop_s = HOP / audio.sample_rate
+            lo, hi = int((st + max_len - 5) / hop_s), int((st + max_len) / hop_s) - 1
+            cut = (lo + int(np.argmin(energy[lo:hi]))) * hop_s if hi > lo else st + max_len
+            windows.append((st, round(cut, 2)))
+            st = round(cut, 2)
+        if windows and ed - windows[-1][0] <= max_len and st - windows[-1][1] <= VAD_MAX_GAP_S:
+            windows[-1] = (windows[-1][0], ed)
+        else:
+            windows.append((st, ed))
+    return windows
+
+
+def restrict_to_speech(segments: list[dict], regions: list[tuple[float, float]], min_len: float = 0.5) -> list[dict]:
+    """
+    Пересекает сегменты диаризации с регионами речи: тишина внутри сегмента
+    вырезается (сегмент может распасться на части того же говорящего),
+    части короче min_len отбрасываются.
+    """
+    if not regions:
+        return []
+    starts = np.array([r[0] for r in regions])
+    ends = np.array([r[1] for r in regions])
+    out = []
+    for seg in segments:
+        # регионы, пересекающие сегмент
+        for i in np.flatnonzero((starts < seg["end"]) & (ends > seg["start"])):
+            st, ed = max(seg["start"], starts[i]), min(seg["end"], ends[i])
+            if ed - st >= min_len:
+                out.append({**seg, "start": round(float(st), 2), "end": round(float(ed), 2)})
+    return out
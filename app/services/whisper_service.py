@@ -184,32 +184,367 @@
 #         'enhancement_duration': round(time.time()-duration,2)
 #     }
 
-import librosa, torch
+import math
+import queue
+import threading
+import time
+import zlib
+from collections import deque
+from concurrent.futures import Future
+import numpy as np
+import torch
+import torch.nn.functional as F
 from transformers import WhisperProcessor, WhisperForConditionalGeneration, pipeline as hf_pipeline
 import os
+from app.services.audio_service import SAMPLE_RATE, AudioBuffer, as_audio_buffer
+
+# torch — fp32 eager, torch-int8 — динамическая int8-квантизация Linear (только CPU),
+# onnx — ONNX Runtime через optimum (экспорт в WHISPER_ONNX_PATH при первом запуске)
+WHISPER_BACKEND = os.getenv("WHISPER_BACKEND", "torch")
+WHISPER_ONNX_PATH = os.getenv("WHISPER_ONNX_PATH", "whisper_onnx")
+
+
+def load_model(path: str, backend: str = WHISPER_BACKEND):
+    if backend == "torch":
+        return WhisperForConditionalGeneration.from_pretrained(path, token=os.getenv("HF_TOKEN")).to(os.getenv("WHISPER_DEVICE"))
+    if backend == "torch-int8":
+        fp32 = WhisperForConditionalGeneration.from_pretrained(path, token=os.getenv("HF_TOKEN")).eval()
+        return torch.ao.quantization.quantize_dynamic(fp32, {torch.nn.Linear}, dtype=torch.qint8)
+    if backend == "onnx":
+        try:
+            from optimum.onnxruntime import ORTModelForSpeechSeq2Seq
+        except ImportError as e:
+            raise RuntimeError("WHISPER_BACKEND=onnx requires `pip install optimum[onnxruntime]`") from e
+        if os.path.isdir(WHISPER_ONNX_PATH):
+            return ORTModelForSpeechSeq2Seq.from_pretrained(WHISPER_ONNX_PATH)
+        ort_model = ORTModelForSpeechSeq2Seq.from_pretrained(path, export=True, token=os.getenv("HF_TOKEN"))
+        ort_model.save_pretrained(WHISPER_ONNX_PATH)
+        return ort_model
+    raise ValueError(f"Unknown WHISPER_BACKEND: {backend}")
+
 
 # загрузка модели Whisper (как у вас сейчас)
-processor = WhisperProcessor.from_pretrained(os.getenv("WHISPER_MODEL_PATH"), use_auth_token=os.getenv("HF_TOKEN"))
-model = WhisperForConditionalGeneration.from_pretrained(os.getenv("WHISPER_MODEL_PATH"), use_auth_token=os.getenv("HF_TOKEN")).to(os.getenv("WHISPER_DEVICE"))
+processor = WhisperProcessor.from_pretrained(os.getenv("WHISPER_MODEL_PATH"), token=os.getenv("HF_TOKEN"))
+model = load_model(os.getenv("WHISPER_MODEL_PATH"))
+# квантизованная и ONNX-модели принимают fp32-признаки и работают на CPU
+INPUT_DTYPE = model.dtype if WHISPER_BACKEND == "torch" else torch.float32
+INPUT_DEVICE = os.getenv("WHISPER_DEVICE") if WHISPER_BACKEND == "torch" else "cpu"
+
+# черновая модель для assisted decoding: меньший чекпойнт Whisper с той же токенизацией
+# (например, дистиллированный с 1–2 слоями декодера); основная модель проверяет её токены
+WHISPER_DRAFT_MODEL_PATH = os.getenv("WHISPER_DRAFT_MODEL_PATH")
+if WHISPER_DRAFT_MODEL_PATH and WHISPER_BACKEND == "onnx":
+    raise ValueError("WHISPER_DRAFT_MODEL_PATH is not supported with WHISPER_BACKEND=onnx")
+draft_model = load_model(WHISPER_DRAFT_MODEL_PATH) if WHISPER_DRAFT_MODEL_PATH else None
+
+# сколько сегментов / 30-секундных чанков прогонять через generate за раз
+WHISPER_BATCH_SIZE = int(os.getenv("WHISPER_BATCH_SIZE", "8"))
+# "global" — кадры спектрограммы всего файла (LogMelSpectrogram), "segment" — processor(...) на каждый сегмент
+WHISPER_FEATURES = os.getenv("WHISPER_FEATURES", "global")
+# общий планировщик батчей для окон всех запросов процесса
+WHISPER_DYNAMIC_BATCHING = os.getenv("WHISPER_DYNAMIC_BATCHING", "0") == "1"
+# сколько ждать добора батча после первого окна
+WHISPER_MAX_WAIT_MS = float(os.getenv("WHISPER_MAX_WAIT_MS", "20"))
 
 asr_pipeline = hf_pipeline(
     task="automatic-speech-recognition",
     model=model,
     tokenizer=processor.tokenizer,
     feature_extractor=processor.feature_extractor,
-    device=int(os.getenv("DEVICE")) if torch.cuda.is_available() else -1,
+    device=int(os.getenv("DEVICE")) if torch.cuda.is_available() and WHISPER_BACKEND == "torch" else -1,
     chunk_length_s=30,
     stride_length_s=(5,5),
 )
 
-def transcribe_segment(audio_path: str, start: float, end: float, task="transcribe"):
-    speech, sr = librosa.load(audio_path, offset=start, duration=end-start, sr=16000)
-    inp = processor(speech, sampling_rate=sr, return_tensors="pt").input_features.to(os.getenv("WHISPER_DEVICE"))
-    kwargs = {'task': 'translate'} if task=='translate' else {}
-    ids = model.generate(inp, **kwargs)
-    return processor.batch_decode(ids, skip_special_tokens=True)[0].strip()
+class LogMelSpectrogram:
+    """
+    Лог-мел спектрограмма записи с теми же кадрами, что у WhisperFeatureExtractor
+    по всему файлу (STFT с центрированием). Кадры окна считаются по его отсчётам
+    и n_fft/2 соседним, поэтому запись (часто memmap PCM-кэша) не копируется
+    целиком и спектр всего файла в памяти не держится; отражение — только
+    на краях записи. Сегменты дополняются до 30 с без повторного вычисления.
+    """
+
+    def __init__(self, audio: AudioBuffer, feature_extractor=None):
+        fe = feature_extractor or processor.feature_extractor
+        self.waveform = audio.waveform
+        self.sample_rate = audio.sample_rate
+        self.hop_length = fe.hop_length
+        self.n_frames = fe.nb_max_frames
+        self.n_fft = fe.n_fft
+        # столько кадров даёт stft(center=True) без последнего, как в WhisperFeatureExtractor
+        self.total = len(self.waveform) // self.hop_length
+        self.stft_window = torch.hann_window(self.n_fft)
+        self.mel_filters = torch.from_numpy(fe.mel_filters).to(torch.float32)
+
+    def frames(self, f0: int, f1: int) -> torch.Tensor:
+        """log10 мел-энергии кадров [f0, f1): (n_mels, f1 - f0)."""
+        if f1 <= f0:
+            return torch.empty(self.mel_filters.shape[1], 0)
+        half, n = self.n_fft // 2, len(self.waveform)
+        # кадр i покрывает отсчёты [i*hop - n_fft/2, i*hop + n_fft/2)
+        lo, hi = f0 * self.hop_length - half, (f1 - 1) * self.hop_length + half
+        wav = torch.from_numpy(np.array(self.waveform[max(lo, 0):min(hi, n)], dtype=np.float32))
+        if lo < 0 or hi > n:
+            mode = "reflect" if n > half else "constant"
+            wav = F.pad(wav[None], (max(-lo, 0), max(hi - n, 0)), mode=mode)[0]
+        stft = torch.stft(wav, self.n_fft, self.hop_length, window=self.stft_window, center=False, return_complex=True)
+        mel = self.mel_filters.T @ (stft.abs() ** 2)
+        return torch.clamp(mel, min=1e-10).log10()
+
+    def window(self, start: float, end: float) -> torch.Tensor:
+        """Признаки сегмента в формате input_features Whisper: (n_mels, 3000)."""
+        f0 = min(int(round(start * self.sample_rate / self.hop_length)), self.total)
+        f1 = min(math.ceil(end * self.sample_rate / self.hop_length), f0 + self.n_frames, self.total)
+        seg = self.frames(f0, f1)
+        # log10(1e-10): так выглядит дополнение нулями до 30 с
+        out = torch.full((seg.shape[0], self.n_frames), -10.0)
+        out[:, :seg.shape[1]] = seg
+        out = torch.maximum(out, out.max() - 8.0)
+        return (out + 4.0) / 4.0
+
+def segment_features(audio: AudioBuffer, windows: list[tuple[float, float]], spec: LogMelSpectrogram = None) -> torch.Tensor:
+    """input_features для списка окон: (len(windows), n_mels, 3000)."""
+    if spec is None:
+        speech = [audio.slice(st, ed) for st, ed in windows]
+        return processor(speech, sampling_rate=SAMPLE_RATE, return_tensors="pt").input_features
+    return torch.stack([spec.window(st, ed) for st, ed in windows])
+
+def _generate_kwargs(task: str) -> dict:
+    return {'task': 'translate'} if task=='translate' else {}
+
+def _generate(inp: torch.Tensor, **kwargs) -> torch.Tensor:
+    """
+    generate по батчу; с черновой моделью — assisted decoding, результат
+    тот же, что у жадного декодирования основной модели. Последовательности
+    возвращаются вместе с токенами подсказки (<|startoftranscript|>, язык, задача).
+    """
+    if draft_model is None:
+        return model.generate(inp, return_dict_in_generate=True, **kwargs).sequences
+    # assisted generation в transformers работает только с батчем из одного примера
+    ids = [model.generate(inp[i:i + 1], assistant_model=draft_model, do_sample=False,
+                          return_dict_in_generate=True, **kwargs).sequences[0]
+           for i in range(len(inp))]
+    return torch.nn.utils.rnn.pad_sequence(ids, batch_first=True, padding_value=processor.tokenizer.pad_token_id)
+
+def _texts(ids: torch.Tensor) -> list[str]:
+    return [txt.strip() for txt in processor.batch_decode(ids, skip_special_tokens=True)]
+
+def compression_ratio(text: str) -> float:
+    """Во сколько раз zlib сжимает текст; у зацикленных галлюцинаций — больше 2.4."""
+    data = text.encode("utf-8")
+    return round(len(data) / len(zlib.compress(data)), 3) if data else 0.0
+
+def _confidences(inp: torch.Tensor, ids: torch.Tensor, texts: list[str], encoded=None) -> list[dict]:
+    """
+    Уверенность Whisper по сегментам, как в openai-whisper: средний log-prob
+    токенов ответа (с <|endoftext|>), коэффициент сжатия текста и вероятность
+    <|nospeech|> сразу после <|startoftranscript|>. Логиты — один проход
+    декодера по уже сгенерированным токенам, по сегменту за раз, чтобы
+    не держать в памяти батч × длина × словарь.
+    """
+    config = model.generation_config
+    eot = config.eos_token_id if isinstance(config.eos_token_id, int) else config.eos_token_id[0]
+    no_timestamps = getattr(config, "no_timestamps_token_id", None)
+    suppress = list(getattr(config, "suppress_tokens", None) or [])
+    out = []
+    with torch.no_grad():
+        for i, (row, text) in enumerate(zip(ids.to(INPUT_DEVICE), texts)):
+            # служебные токены Whisper идут в словаре начиная с <|endoftext|>: всё до первого обычного — подсказка
+            ordinary = (row < eot).nonzero()
+            first = max(int(ordinary[0]) if len(ordinary) else int((row == eot).nonzero()[0]), 1)
+            ends = (row[first:] == eot).nonzero()
+            last = first + int(ends[0]) if len(ends) else len(row) - 1
+            tokens = row[:last + 1].unsqueeze(0)
+            if encoded is not None:
+                logits = model(encoder_outputs=(encoded.last_hidden_state[i:i + 1],), decoder_input_ids=tokens).logits[0]
+            else:
+                logits = model(input_features=inp[i:i + 1], decoder_input_ids=tokens).logits[0]
+            logits = logits.float()
+            no_speech = 0.0
+            if no_timestamps is not None and int(row[0]) == config.decoder_start_token_id:
+                # <|nospeech|> стоит в словаре прямо перед <|notimestamps|>
+                no_speech = float(logits[0].softmax(-1)[no_timestamps - 1])
+            # токены, которые generate запрещает, не участвуют в нормировке, как и при декодировании
+            logits[:, suppress] = -math.inf
+            if no_timestamps is not None:
+                logits[:, no_timestamps + 1:] = -math.inf
+            logprobs = logits.log_softmax(-1)
+            picked = logprobs[first - 1:last].gather(-1, row[first:last + 1, None])
+            out.append({
+                "avg_logprob": round(float(picked.mean()), 4),
+                "compression_ratio": compression_ratio(text),
+                "no_speech_prob": round(no_speech, 4),
+            })
+    return out
+
+def _decode_batch(features: torch.Tensor, task: str, with_confidence: bool = False):
+    """
+    Один generate по батчу input_features.
+    task="both" — пары (текст, перевод на английский): энкодер считается
+    один раз, декодер проходит дважды с токенами transcribe и translate.
+    with_confidence — ещё и список уверенностей (_confidences) по тексту
+    на языке записи: возвращается пара (выходы, уверенности).
+    """
+    inp = features.to(INPUT_DEVICE, dtype=INPUT_DTYPE)
+    encoded = None
+    # assisted decoding и ONNX Runtime не принимают готовые encoder_outputs
+    if (task == "both" or with_confidence) and draft_model is None and WHISPER_BACKEND != "onnx":
+        with torch.no_grad():
+            encoded = model.get_encoder()(inp)
+
+    def generate(t):
+        if encoded is not None:
+            return model.generate(encoder_outputs=encoded, return_dict_in_generate=True, **_generate_kwargs(t)).sequences
+        return _generate(inp, **_generate_kwargs(t))
+
+    ids = generate("transcribe" if task == "both" else task)
+    texts = _texts(ids)
+    outputs = list(zip(texts, _texts(generate("translate")))) if task == "both" else texts
+    if not with_confidence:
+        return outputs
+    return outputs, _confidences(inp, ids, texts, encoded)
+
+class _Pending:
+    __slots__ = ("features", "task", "with_confidence", "future", "enqueued")
+
+    def __init__(self, features: torch.Tensor, task: str, with_confidence: bool = False):
+        self.features = features
+        self.task = task
+        self.with_confidence = with_confidence
+        self.future = Future()
+        self.enqueued = time.monotonic()
+
+class BatchScheduler:
+    """
+    Динамический батчинг окон от всех одновременных запросов.
+    Фоновый поток берёт первое окно из очереди, добирает батч до max_batch
+    окон или max_wait_ms с момента постановки первого, делает один generate
+    и раздаёт по Future пары (текст, уверенность или None). Окна с другой
+    задачей ждут следующего батча.
+    """
+
+    def __init__(self, max_batch: int, max_wait_ms: float):
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._carry = deque()
+        self._lock = threading.Lock()
+        self._batches = 0
+        self._items = 0
+        self._delays = deque(maxlen=1000)  # задержка в очереди последних окон, с
+        threading.Thread(target=self._loop, name="whisper-batcher", daemon=True).start()
+
+    def submit(self, features: torch.Tensor, task: str, with_confidence: bool = False) -> Future:
+        item = _Pending(features, task, with_confidence)
+        self._queue.put(item)
+        return item.future
+
+    def _next(self, timeout: float = None):
+        if self._carry:
+            return self._carry.popleft()
+        return self._queue.get(timeout=timeout)
+
+    def _collect(self) -> list:
+        first = self._next()
+        batch = [first]
+        deadline = first.enqueued + self.max_wait
+        skipped = []
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0 and self._queue.empty() and not self._carry:
+                break
+            try:
+                item = self._next(timeout=max(timeout, 0))
+            except queue.Empty:
+                break
+            (batch if item.task == first.task else skipped).append(item)
+        self._carry.extendleft(reversed(skipped))
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            started = time.monotonic()
+            # уверенность считается для всего батча, если она нужна хоть одному окну
+            with_confidence = any(item.with_confidence for item in batch)
+            try:
+                result = _decode_batch(torch.stack([item.features for item in batch]), batch[0].task, with_confidence)
+            except Exception as e:
+                for item in batch:
+                    item.future.set_exception(e)
+                continue
+            texts, confidences = result if with_confidence else (result, [None] * len(batch))
+            for item, txt, conf in zip(batch, texts, confidences):
+                item.future.set_result((txt, conf))
+            with self._lock:
+                self._batches += 1
+                self._items += len(batch)
+                self._delays.extend(started - item.enqueued for item in batch)
+
+    def stats(self) -> dict:
+        with self._lock:
+            delays = sorted(self._delays)
+            return {
+                "batches": self._batches,
+                "segments": self._items,
+                "max_batch": self.max_batch,
+                "max_wait_ms": self.max_wait * 1000,
+                "avg_batch_fill": round(self._items / self._batches / self.max_batch, 3) if self._batches else 0.0,
+                "queue_delay_ms_p50": round(delays[len(delays) // 2] * 1000, 1) if delays else 0.0,
+                "queue_delay_ms_p95": round(delays[int(len(delays) * 0.95)] * 1000, 1) if delays else 0.0,
+                "queued": self._queue.qsize() + len(self._carry),
+            }
+
+scheduler = BatchScheduler(WHISPER_BATCH_SIZE, WHISPER_MAX_WAIT_MS) if WHISPER_DYNAMIC_BATCHING else None
+
+def batching_stats() -> dict:
+    return scheduler.stats() if scheduler else {"enabled": False}
+
+def transcribe_segment(audio: str | AudioBuffer, start: float, end: float, task="transcribe"):
+    return transcribe_segments(audio, [(start, end)], task=task, batch_size=1)[0]
+
+def transcribe_segments(audio: str | AudioBuffer, windows: list[tuple[float, float]], task="transcribe",
+                        batch_size: int = None, with_confidence: bool = False):
+    """
+    Батчевая транскрипция списка окон (start, end) одного файла;
+    для task="both" — пары (текст, перевод).
+    with_confidence=True — пара списков (выходы, уверенности), см. _confidences.
+    Сегменты сортируются по длительности, чтобы в батче были близкие по длине
+    ответы декодера, результат возвращается в исходном порядке.
+    С WHISPER_DYNAMIC_BATCHING окна уходят в общий планировщик и попадают
+    в батчи вместе с окнами других запросов.
+    """
+    batch_size = batch_size or WHISPER_BATCH_SIZE
+    if not windows:
+        return ([], []) if with_confidence else []
+    audio = as_audio_buffer(audio)
+    spec = LogMelSpectrogram(audio) if WHISPER_FEATURES == "global" else None
+    if scheduler:
+        # не больше двух батчей признаков одного запроса в очереди одновременно
+        futures, results = [], []
+        for w in windows:
+            futures.append(scheduler.submit(segment_features(audio, [w], spec)[0], task, with_confidence))
+            if len(futures) - len(results) >= 2 * batch_size:
+                results.append(futures[len(results)].result())
+        results += [f.result() for f in futures[len(results):]]
+        texts, confidences = [r[0] for r in results], [r[1] for r in results]
+    else:
+        order = sorted(range(len(windows)), key=lambda i: windows[i][1] - windows[i][0])
+        texts, confidences = [""] * len(windows), [None] * len(windows)
+        for b in range(0, len(order), batch_size):
+            idx = order[b:b+batch_size]
+            result = _decode_batch(segment_features(audio, [windows[i] for i in idx], spec), task, with_confidence)
+            batch_texts, batch_confidences = result if with_confidence else (result, [None] * len(idx))
+            for i, txt, conf in zip(idx, batch_texts, batch_confidences):
+                texts[i], confidences[i] = txt, conf
+    return (texts, confidences) if with_confidence else texts
 
-def transcribe_full(audio_path: str, task="transcribe"):
-    kwargs = {'task':'translate'} if task=='translate' else {}
-    res = asr_pipeline(audio_path, **kwargs)
+def transcribe_full(audio: str | AudioBuffer, task="transcribe", batch_size: int = None):
+    if task == "both":
+        # конвейер HF не отдаёт выход энкодера, здесь две полные прогонки
+        return transcribe_full(audio, "transcribe", batch_size), transcribe_full(audio, "translate", batch_size)
+    if isinstance(audio, AudioBuffer):
+        audio = {"raw": audio.waveform, "sampling_rate": audio.sample_rate}
+    res = asr_pipeline(audio, batch_size=batch_size or WHISPER_BATCH_SIZE, **_generate_kwargs(task))
     return res['text'] if isinstance(res, dict) else str(res)
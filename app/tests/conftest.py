@@ -0,0 +1,11 @@
+# app/tests/conftest.py
+import os
+import tempfile
+
+# модули приложения читают настройки при импорте: тестам хватает SQLite
+# во временном каталоге и фиктивного S3 (запросы к нему не выполняются)
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test.db')}")
+os.environ.setdefault("S3_ACCESS_KEY", "test")
+os.environ.setdefault("S3_SECRET_KEY", "test")
+os.environ.setdefault("S3_ENDPOINT_URL", "http://127.0.0.1:9000")
+os.environ.setdefault("S3_BUCKET_NAME", "test")
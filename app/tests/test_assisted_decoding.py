@@ -0,0 +1,59 @@
+# app/tests/test_assisted_decoding.py
+import importlib
+import os
+import sys
+
+import numpy as np
+import pytest
+import torch
+
+from app.services.audio_service import AudioBuffer
+from scripts.bench_assisted import build_tiny
+
+WINDOWS = [(0.0, 3.0), (3.0, 8.0), (8.0, 12.0)]
+
+
+@pytest.fixture(scope="module")
+def whisper(tmp_path_factory):
+    """whisper_service на маленьких чекпойнтах scripts.bench_assisted --build-tiny с черновой моделью."""
+    if "app.services.whisper_service" in sys.modules:
+        pytest.skip("whisper_service already loaded with other models")
+    main, draft = build_tiny(str(tmp_path_factory.mktemp("whisper-tiny")))
+    env = {"WHISPER_MODEL_PATH": main, "WHISPER_DRAFT_MODEL_PATH": draft, "WHISPER_DEVICE": "cpu",
+           "WHISPER_BACKEND": "torch", "WHISPER_DYNAMIC_BATCHING": "0"}
+    saved = {key: os.environ.get(key) for key in env}
+    os.environ.update(env)
+    try:
+        service = importlib.import_module("app.services.whisper_service")
+    finally:
+        for key, value in saved.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+    # случайные веса редко выдают <|endoftext|>, ответы ограничены по длине
+    service.model.generation_config.max_new_tokens = 16
+    yield service
+    sys.modules.pop("app.services.whisper_service", None)
+
+
+@pytest.fixture
+def features(whisper):
+    audio = AudioBuffer((0.1 * np.random.default_rng(0).standard_normal(16000 * 12)).astype(np.float32))
+    return whisper.segment_features(audio, WINDOWS, whisper.LogMelSpectrogram(audio))
+
+
+def test_assisted_generate_matches_greedy(whisper, features, monkeypatch):
+    assert whisper.draft_model is not None
+    assisted = whisper._generate(features)
+    monkeypatch.setattr(whisper, "draft_model", None)
+    greedy = whisper._generate(features)
+    assert torch.equal(assisted, greedy)
+
+
+def test_assisted_decode_batch_matches_greedy(whisper, features, monkeypatch):
+    assisted, assisted_conf = whisper._decode_batch(features, "transcribe", with_confidence=True)
+    monkeypatch.setattr(whisper, "draft_model", None)
+    greedy, greedy_conf = whisper._decode_batch(features, "transcribe", with_confidence=True)
+    assert assisted == greedy
+    assert [c["avg_logprob"] for c in assisted_conf] == pytest.approx([c["avg_logprob"] for c in greedy_conf], abs=1e-3)
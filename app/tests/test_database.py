@@ -0,0 +1,29 @@
+# app/tests/test_database.py
+from sqlalchemy import inspect, text
+
+from app.db.database import SessionLocal, engine, init_schema
+from app.models import user_model, chat_session_model  # noqa: F401 — таблицы для init_schema
+from app.models.audio_model import AudioTranscription, Base
+
+
+def test_init_schema_adds_missing_columns():
+    # таблица в том виде, в каком она была до колонки translation
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE audio_transcriptions (id INTEGER PRIMARY KEY, original_filename VARCHAR NOT NULL, "
+            "s3_filename VARCHAR NOT NULL UNIQUE, s3_url VARCHAR NOT NULL, file_size INTEGER, duration FLOAT, "
+            "language VARCHAR, transcription TEXT, diarization_data JSON, created_at DATETIME, "
+            "formatted_transcription TEXT, speakers JSON, overall_emotion VARCHAR, polished_text TEXT)"
+        ))
+    try:
+        init_schema(Base.metadata)
+        init_schema(Base.metadata)
+
+        assert "translation" in {c["name"] for c in inspect(engine).get_columns("audio_transcriptions")}
+        with SessionLocal() as db:
+            db.add(AudioTranscription(original_filename="a.wav", s3_filename="a.wav", s3_url="s3://a.wav",
+                                      translation="hello"))
+            db.commit()
+            assert db.query(AudioTranscription).one().translation == "hello"
+    finally:
+        Base.metadata.drop_all(bind=engine)
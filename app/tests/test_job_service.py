@@ -0,0 +1,133 @@
+# app/tests/test_job_service.py
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.db.database import SessionLocal, engine
+from app.models import user_model, chat_session_model  # noqa: F401 — таблицы для create_all
+from app.models.audio_model import AudioTranscription, Base
+from app.models.job_model import TranscriptionJob
+from app.services import job_service
+
+FILE_INFO = {"original_filename": "a.wav", "s3_filename": "a.wav", "s3_url": "s3://a.wav", "size": 10}
+RESULT = {
+    "duration": 1.0, "text": "сәлем", "formatted_text": "сәлем", "speakers": [], "segments": [],
+    "overall_emotion": None, "polished_text": "Сәлем.",
+}
+
+
+@pytest.fixture
+def db():
+    Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+        Base.metadata.drop_all(bind=engine)
+
+
+def _job(db) -> TranscriptionJob:
+    return job_service.create_job(db, 1, FILE_INFO, "kk", "transcribe", False)
+
+
+def _expire_lease(db, job_id: str):
+    db.query(TranscriptionJob).filter(TranscriptionJob.id == job_id).update(
+        {"lease_expires_at": datetime.now() - timedelta(seconds=1)})
+    db.commit()
+
+
+def _fake_pipeline(monkeypatch, run=None):
+    monkeypatch.setattr(job_service.storage_service, "download_file", lambda key, path: None)
+
+    async def transcribe_pipeline(*args):
+        if run:
+            run()
+        return RESULT
+    monkeypatch.setattr(job_service, "transcribe_pipeline", transcribe_pipeline)
+
+
+def test_claim_takes_oldest_queued_job(db):
+    first, second = _job(db), _job(db)
+    job = job_service.claim_job(db, "w1")
+    assert job.id == first.id
+    assert (job.status, job.worker_id, job.attempts) == ("running", "w1", 1)
+    assert job_service.claim_job(db, "w2").id == second.id
+    assert job_service.claim_job(db, "w3") is None
+
+
+def test_running_job_is_not_claimed_until_lease_expires(db):
+    job = _job(db)
+    job_service.claim_job(db, "w1")
+    assert job_service.claim_job(db, "w2") is None
+
+    _expire_lease(db, job.id)
+    taken = job_service.claim_job(db, "w2")
+    assert (taken.id, taken.worker_id, taken.attempts) == (job.id, "w2", 2)
+
+
+def test_expired_job_fails_after_max_attempts(db, monkeypatch):
+    monkeypatch.setattr(job_service, "JOB_MAX_ATTEMPTS", 1)
+    job = _job(db)
+    job_service.claim_job(db, "w1")
+    _expire_lease(db, job.id)
+
+    assert job_service.claim_job(db, "w2") is None
+    db.refresh(job)
+    assert (job.status, job.worker_id) == ("failed", None)
+
+
+def test_renew_lease_only_for_owner(db):
+    job = _job(db)
+    job_service.claim_job(db, "w1")
+    _expire_lease(db, job.id)
+
+    assert job_service.renew_lease(job.id, "w1")
+    db.refresh(job)
+    assert job.lease_expires_at > datetime.now()
+    assert job_service.claim_job(db, "w2") is None
+    assert not job_service.renew_lease(job.id, "w2")
+
+
+def test_process_job_saves_result(db, monkeypatch):
+    _fake_pipeline(monkeypatch)
+    _job(db)
+    job = job_service.claim_job(db, "w1")
+    job_service.process_job(db, job, "w1")
+
+    db.refresh(job)
+    assert (job.status, job.worker_id, job.lease_expires_at) == ("done", None, None)
+    assert db.get(AudioTranscription, job.audio_transcription_id).polished_text == "Сәлем."
+
+
+def test_process_job_discards_result_after_lease_lost(db, monkeypatch):
+    job_id = _job(db).id
+
+    def steal():
+        # пока w1 считает, его аренда истекает и задачу забирает w2
+        other = SessionLocal()
+        try:
+            _expire_lease(other, job_id)
+            assert job_service.claim_job(other, "w2").id == job_id
+        finally:
+            other.close()
+    _fake_pipeline(monkeypatch, steal)
+
+    job = job_service.claim_job(db, "w1")
+    job_service.process_job(db, job, "w1")
+
+    db.refresh(job)
+    assert (job.status, job.worker_id, job.attempts) == ("running", "w2", 2)
+    assert db.query(AudioTranscription).count() == 0
+
+
+def test_process_job_requeues_on_error(db, monkeypatch):
+    def crash():
+        raise RuntimeError("boom")
+    _fake_pipeline(monkeypatch, crash)
+    _job(db)
+    job = job_service.claim_job(db, "w1")
+    job_service.process_job(db, job, "w1")
+
+    db.refresh(job)
+    assert (job.status, job.worker_id, job.error) == ("queued", None, "boom")
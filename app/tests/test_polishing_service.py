@@ -0,0 +1,150 @@
+# app/tests/test_polishing_service.py
+import asyncio
+import socket
+import threading
+import time
+
+import pytest
+import uvicorn
+
+from app.services import polishing_service
+from scripts import fake_openai
+
+
+def test_packs_only_join_adjacent_segments():
+    segments = [{"text": "сәлем әлем"}] * 6
+    assert polishing_service._packs(segments) == [[0, 1, 2, 3, 4, 5]]
+    # сегменты 2 и 6–8 пропущены как уверенные: пачки не склеивают 1 с 3 и 5 с 9
+    assert polishing_service._packs(segments, [0, 1, 3, 4, 5, 9]) == [[0, 1], [2, 3, 4], [5]]
+
+
+@pytest.fixture(scope="module")
+def fake_server():
+    """scripts.fake_openai в фоновом потоке; config и stats меняются прямо из тестов."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(fake_openai.app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    yield f"http://127.0.0.1:{port}/v1"
+    server.should_exit = True
+    thread.join()
+
+
+@pytest.fixture
+def openai(fake_server, monkeypatch):
+    monkeypatch.setenv("OPENAI_BASE_URL", fake_server)
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setattr(polishing_service, "OPENAI_ENABLED", True)
+    monkeypatch.setattr(polishing_service, "POLISH_BACKOFF_S", 0.01)
+    # вероятность, что запрос исчерпает повторы при 30% ошибок, — 0.3^11
+    monkeypatch.setattr(polishing_service, "POLISH_MAX_RETRIES", 10)
+    monkeypatch.setattr(polishing_service, "limiter", polishing_service.RateLimiter(0, 0))
+    monkeypatch.setattr(polishing_service, "_examples_batch", _no_examples)
+    monkeypatch.setitem(fake_openai.config, "latency", 0.0)
+    for key in fake_openai.stats:
+        monkeypatch.setitem(fake_openai.stats, key, 0)
+    return fake_openai
+
+
+async def _no_examples(texts, k):
+    return [[] for _ in texts]
+
+
+def _run(coro):
+    async def main():
+        try:
+            return await coro
+        finally:
+            await polishing_service.close_client()
+    return asyncio.run(main())
+
+
+def _segments(count: int) -> list[dict]:
+    return [{"start": float(i), "end": i + 1.0, "speaker": f"SPEAKER_0{i % 2}", "text": f"сегмент {i} мәтіні"}
+            for i in range(count)]
+
+
+@pytest.mark.parametrize("packed", [True, False])
+def test_polish_segments_retries_and_keeps_order(openai, monkeypatch, caplog, packed):
+    monkeypatch.setattr(polishing_service, "POLISH_PACKED", packed)
+    monkeypatch.setattr(polishing_service, "POLISH_PACK_TOKENS", 20)
+    monkeypatch.setitem(openai.config, "error_rate", 0.3)
+    segments = _segments(60)
+
+    polished = _run(polishing_service.polish_segments(segments, "kk"))
+
+    assert [seg["start"] for seg in polished] == [seg["start"] for seg in segments]
+    assert [seg["polished_text"] for seg in polished] == [seg["text"] for seg in segments]
+    assert openai.stats["errors"] > 0
+    assert "retry" in caplog.text
+    # после повторов ни один сегмент не остался без ответа модели
+    assert not [r for r in caplog.records if r.levelname == "ERROR"]
+
+
+def test_unparsed_pack_segments_stay_within_concurrency(monkeypatch):
+    monkeypatch.setattr(polishing_service, "OPENAI_ENABLED", True)
+    monkeypatch.setattr(polishing_service, "POLISH_PACK_TOKENS", 30)
+    monkeypatch.setattr(polishing_service, "_examples_batch", _no_examples)
+    calls = {"active": 0, "max_active": 0, "single": 0}
+
+    async def complete(language, prompt, expected_tokens, json_mode=False):
+        calls["active"] += 1
+        calls["max_active"] = max(calls["max_active"], calls["active"])
+        await asyncio.sleep(0.01)
+        calls["active"] -= 1
+        if json_mode:
+            return "{}"  # ни один сегмент пачки не разобран
+        calls["single"] += 1
+        return prompt.rsplit('"', 2)[-2]
+
+    monkeypatch.setattr(polishing_service, "_complete", complete)
+    segments = _segments(20)
+
+    polished = asyncio.run(polishing_service.polish_segments(segments, "kk", asyncio.Semaphore(2)))
+
+    assert [seg["polished_text"] for seg in polished] == [seg["text"] for seg in segments]
+    assert calls["single"] == 20
+    assert calls["max_active"] <= 2
+
+
+def test_polish_segments_falls_back_to_raw_text(openai, monkeypatch):
+    monkeypatch.setattr(polishing_service, "POLISH_MAX_RETRIES", 2)
+    monkeypatch.setitem(openai.config, "error_rate", 1.0)
+    segments = _segments(5)
+
+    polished = _run(polishing_service.polish_segments(segments, "kk"))
+
+    assert [seg["polished_text"] for seg in polished] == [seg["text"] for seg in segments]
+    assert openai.stats["chat"] == 0
+    assert openai.stats["errors"] == 3
+
+
+def test_polish_text_chunks_keep_order(openai, monkeypatch, caplog):
+    monkeypatch.setattr(polishing_service, "POLISH_TEXT_CHUNK_TOKENS", 40)
+    monkeypatch.setitem(openai.config, "error_rate", 0.3)
+    text = " ".join(f"Бұл {i}-сөйлем." for i in range(60))
+
+    assert _run(polishing_service.polish_text(text, "kk")) == text
+    assert openai.stats["chat"] > 1
+    assert not [r for r in caplog.records if r.levelname == "ERROR"]
+
+
+def test_polish_text_falls_back_to_raw_text(openai, monkeypatch):
+    monkeypatch.setattr(polishing_service, "POLISH_MAX_RETRIES", 1)
+    monkeypatch.setitem(openai.config, "error_rate", 1.0)
+    text = "Сәлем, әлем. Қалыңыз қалай?"
+    assert _run(polishing_service.polish_text(text, "kk")) == text
+
+
+def test_client_is_closed_with_its_loop(openai):
+    async def main():
+        client = polishing_service._client()
+        await polishing_service.close_client()
+        return client
+
+    assert asyncio.run(main()).is_closed()
+    assert not polishing_service._clients
@@ -0,0 +1,29 @@
+# app/tests/test_streaming_service.py
+import numpy as np
+import pytest
+import soxr
+
+from app.services.streaming_service import PcmDecoder
+
+
+def _decode_in_pieces(decoder: PcmDecoder, data: bytes, piece: int) -> np.ndarray:
+    parts = [decoder(data[i:i + piece]) for i in range(0, len(data), piece)]
+    return np.concatenate(parts + [decoder.flush()])
+
+
+def test_pcm_decoder_joins_samples_split_between_messages():
+    samples = (np.sin(np.arange(1600) / 10) * 20000).astype("<i2")
+    out = _decode_in_pieces(PcmDecoder("pcm_s16le", 16000), samples.tobytes(), 333)
+    np.testing.assert_array_equal(out, samples.astype(np.float32) / 32768.0)
+
+
+def test_pcm_decoder_resamples_the_stream_as_a_whole():
+    sr = 44100
+    audio = np.sin(2 * np.pi * 440 * np.arange(2 * sr) / sr).astype(np.float32)
+    out = _decode_in_pieces(PcmDecoder("pcm_f32le", sr), audio.tobytes(), 4410 * 4 + 3)
+    np.testing.assert_allclose(out, soxr.resample(audio, sr, 16000), atol=1e-6)
+
+
+def test_pcm_decoder_rejects_unknown_format():
+    with pytest.raises(ValueError):
+        PcmDecoder("mp3", 16000)
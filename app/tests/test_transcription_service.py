@@ -0,0 +1,133 @@
+# app/tests/test_transcription_service.py
+import asyncio
+
+import pytest
+
+from app.services import transcription_service
+
+
+def _chunks(count: int, size: int) -> list[list[dict]]:
+    segments = [{"start": float(i), "end": i + 1.0, "speaker": "SPEAKER_00", "text": "сөз " * 10} for i in range(count)]
+    return [segments[i:i + size] for i in range(0, count, size)]
+
+
+async def _run_stage(chunks, language="kk"):
+    inbox, outbox = asyncio.Queue(), asyncio.Queue()
+    for chunk in chunks:
+        inbox.put_nowait(chunk)
+    inbox.put_nowait(transcription_service._DONE)
+    await transcription_service._polish_stage(inbox, outbox, language)
+    out = []
+    while (item := outbox.get_nowait()) is not transcription_service._DONE:
+        if isinstance(item, Exception):
+            return item
+        out.append(item)
+    return out
+
+
+@pytest.fixture
+def stage(monkeypatch):
+    monkeypatch.setattr(transcription_service, "OPENAI_ENABLED", True)
+    monkeypatch.setattr(transcription_service, "POLISH_PACK_TOKENS", 30)
+    monkeypatch.setattr(transcription_service, "POLISH_STAGE_PACKS", 2)
+    monkeypatch.setattr(transcription_service, "POLISH_STAGE_IN_FLIGHT", 3)
+    calls = {"batches": [], "active": 0, "max_active": 0}
+
+    async def polish_segments(segments, language, semaphore=None):
+        calls["batches"].append(len(segments))
+        calls["active"] += 1
+        calls["max_active"] = max(calls["max_active"], calls["active"])
+        # ранние партии отвечают дольше поздних
+        await asyncio.sleep(0.05 / len(calls["batches"]))
+        calls["active"] -= 1
+        return [{**seg, "polished_text": seg["text"].upper()} for seg in segments]
+
+    monkeypatch.setattr(transcription_service, "polish_segments", polish_segments)
+    return calls
+
+
+def test_polish_stage_batches_by_tokens_and_keeps_order(stage):
+    out = asyncio.run(_run_stage(_chunks(40, 8)))
+
+    assert [seg["start"] for seg in out] == [float(i) for i in range(40)]
+    assert all(seg["polished_text"] == seg["text"].upper() for seg in out)
+    # 8 сегментов по 14 токенов — уже больше бюджета партии в 60 токенов
+    assert stage["batches"] == [8] * 5
+    assert stage["max_active"] > 1
+
+
+def test_polish_stage_joins_small_chunks(stage):
+    out = asyncio.run(_run_stage(_chunks(10, 2)))
+
+    assert [seg["start"] for seg in out] == [float(i) for i in range(10)]
+    assert stage["batches"] == [6, 4]
+
+
+def test_polish_stage_skips_batching_without_openai(stage, monkeypatch):
+    monkeypatch.setattr(transcription_service, "OPENAI_ENABLED", False)
+    asyncio.run(_run_stage(_chunks(6, 2)))
+    assert stage["batches"] == [2, 2, 2]
+
+
+def test_polish_stage_forwards_errors(stage, monkeypatch):
+    async def fail(segments, language, semaphore=None):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(transcription_service, "polish_segments", fail)
+    error = asyncio.run(_run_stage(_chunks(4, 2)))
+    assert isinstance(error, RuntimeError) and str(error) == "boom"
+
+
+def test_polish_stage_forwards_upstream_errors(stage):
+    error = asyncio.run(_run_stage(_chunks(4, 2) + [ValueError("upstream")]))
+    assert isinstance(error, ValueError)
+
+
+async def _emit_times(chunks, delay):
+    """Время выхода каждого сегмента из стадии, если куски приходят раз в delay секунд."""
+    loop = asyncio.get_running_loop()
+    inbox, outbox = asyncio.Queue(), asyncio.Queue()
+    start = loop.time()
+
+    async def feed():
+        for chunk in chunks:
+            await inbox.put(chunk)
+            await asyncio.sleep(delay)
+        await inbox.put(transcription_service._DONE)
+
+    feeder = asyncio.create_task(feed())
+    stage = asyncio.create_task(transcription_service._polish_stage(inbox, outbox, "kk"))
+    times = []
+    while (item := await outbox.get()) is not transcription_service._DONE:
+        times.append(loop.time() - start)
+    await asyncio.gather(feeder, stage)
+    return times
+
+
+def _confident(chunks):
+    conf = {"avg_logprob": -0.1, "compression_ratio": 1.2, "no_speech_prob": 0.01}
+    return [[{**seg, "confidence": conf} for seg in chunk] for chunk in chunks]
+
+
+def test_polish_stage_passes_confident_chunks_through(stage):
+    times = asyncio.run(_emit_times(_confident(_chunks(5, 1)), delay=0.2))
+
+    assert stage["batches"] == [1] * 5
+    # каждый сегмент выходит до прихода следующего, а не в конце записи
+    assert all(t < 0.2 * i + 0.15 for i, t in enumerate(times))
+
+
+def test_polish_stage_flushes_after_max_wait(stage, monkeypatch):
+    monkeypatch.setattr(transcription_service, "POLISH_PACK_TOKENS", 10_000)
+    monkeypatch.setattr(transcription_service, "POLISH_STAGE_MAX_WAIT_S", 0.1)
+    times = asyncio.run(_emit_times(_chunks(4, 1), delay=0.3))
+
+    assert stage["batches"] == [1] * 4
+    assert times[0] < 0.25
+
+
+def test_polish_stage_flushes_on_segment_limit(stage, monkeypatch):
+    monkeypatch.setattr(transcription_service, "POLISH_PACK_TOKENS", 10_000)
+    monkeypatch.setattr(transcription_service, "POLISH_STAGE_MAX_SEGMENTS", 4)
+    asyncio.run(_run_stage(_chunks(10, 2)))
+    assert stage["batches"] == [4, 4, 2]
@@ -0,0 +1,46 @@
+"""
+Отдельный воркер очереди транскрипции:
+
+    python -m app.worker
+
+Модели загружаются один раз при старте (с CPU_EXECUTOR=process — в процессах
+пула, с MODEL_SERVER_ADDRESS — в сервере моделей), затем WORKER_CONCURRENCY потоков
+забирают задачи из таблицы transcription_jobs и скачивают аудио из S3.
+Воркеров можно добавлять на любых машинах с доступом к БД и S3.
+"""
+import logging
+import os
+import signal
+import threading
+
+from dotenv import load_dotenv
+
+load_dotenv()
+os.environ['KMP_DUPLICATE_LIB_OK'] = 'TRUE'
+
+from app.db.database import init_schema
+from app.models.audio_model import Base
+from app.core.executors import warmup_inference
+from app.services.job_service import start_workers
+
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", "1"))
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    init_schema(Base.metadata)
+    warmup_inference()
+
+    stop = threading.Event()
+    # SIGTERM/SIGINT: дорабатываем текущие задачи и выходим
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+
+    threads = start_workers(WORKER_CONCURRENCY, stop)
+    for thread in threads:
+        while thread.is_alive():
+            thread.join(timeout=1)
+
+
+if __name__ == "__main__":
+    main()
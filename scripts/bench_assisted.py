@@ -0,0 +1,128 @@
+"""
+Скорость декодирования Whisper с черновой моделью (WHISPER_DRAFT_MODEL_PATH)
+и без неё: токенов в секунду и совпадение вывода с жадным декодированием.
+
+    python -m scripts.bench_assisted --model $WHISPER_MODEL_PATH --draft path/to/draft --audio sample.wav
+    # маленькие локальные чекпойнты (случайные веса) для проверки без скачивания
+    python -m scripts.bench_assisted --build-tiny /tmp/whisper-tiny-bench
+"""
+import argparse
+import copy
+import os
+import time
+
+import numpy as np
+import torch
+from dotenv import load_dotenv
+from transformers import (WhisperConfig, WhisperFeatureExtractor, WhisperForConditionalGeneration,
+                          WhisperProcessor, WhisperTokenizer)
+from transformers.models.whisper.tokenization_whisper import LANGUAGES
+
+load_dotenv()
+
+
+def tiny_processor(config: WhisperConfig) -> WhisperProcessor:
+    """
+    Процессор без скачивания: байтовый алфавит GPT-2, заглушки «tN» вместо
+    остальных обычных токенов и служебные токены Whisper на своих местах,
+    чтобы приложение могло загрузить маленький чекпойнт по WHISPER_MODEL_PATH.
+    """
+    printable = [*range(ord("!"), ord("~") + 1), *range(ord("¡"), ord("¬") + 1), *range(ord("®"), ord("ÿ") + 1)]
+    # байты вне printable GPT-2 кодирует символами начиная с U+0100
+    alphabet = [chr(b) if b in printable else chr(256 + sum(c not in printable for c in range(b))) for b in range(256)]
+    vocab = {ch: i for i, ch in enumerate(alphabet)}
+    vocab.update({f"t{i}": i for i in range(len(alphabet), config.eos_token_id)})
+    specials = ["<|endoftext|>", "<|startoftranscript|>", *(f"<|{code}|>" for code in LANGUAGES),
+                "<|translate|>", "<|transcribe|>", "<|startoflm|>", "<|startofprev|>", "<|nocaptions|>",
+                "<|notimestamps|>"]
+    timestamps = [f"<|{i * 0.02:.2f}|>" for i in range(config.vocab_size - config.eos_token_id - len(specials))]
+    tokenizer = WhisperTokenizer(vocab=vocab, merges=[], pad_token="<|endoftext|>")
+    tokenizer.add_special_tokens({"additional_special_tokens": specials + timestamps})
+    return WhisperProcessor(WhisperFeatureExtractor(), tokenizer)
+
+
+def build_tiny(directory: str) -> tuple[str, str]:
+    """
+    Основная модель (4 слоя декодера) и черновая с её энкодером, эмбеддингами
+    и первым слоем декодера — как у дистиллированных черновиков Whisper.
+    Рядом с весами сохраняется процессор (tiny_processor).
+    """
+    torch.manual_seed(0)
+    # init_std крупнее стандартного: иначе случайная модель повторяет один токен,
+    # и черновик «угадывает» всё, ничего не проверяя
+    config = WhisperConfig(
+        d_model=256, encoder_layers=2, decoder_layers=4, encoder_attention_heads=4, decoder_attention_heads=4,
+        encoder_ffn_dim=1024, decoder_ffn_dim=1024, max_target_positions=256, init_std=0.1,
+    )
+    main = WhisperForConditionalGeneration(config).eval()
+    draft_config = copy.deepcopy(config)
+    draft_config.decoder_layers = 1
+    draft = WhisperForConditionalGeneration(draft_config).eval()
+    draft.load_state_dict({k: v for k, v in main.state_dict().items() if k in draft.state_dict()}, strict=False)
+
+    paths = os.path.join(directory, "main"), os.path.join(directory, "draft")
+    for model, path in zip((main, draft), paths):
+        model.save_pretrained(path)
+        tiny_processor(config).save_pretrained(path)
+    return paths
+
+
+def features(model_path: str, audio_path: str, segments: int, seconds: float) -> list[torch.Tensor]:
+    from app.services.audio_service import SAMPLE_RATE, AudioBuffer
+
+    fe = WhisperFeatureExtractor.from_pretrained(model_path)
+    if audio_path:
+        audio = AudioBuffer.from_file(audio_path)
+    else:
+        rng = np.random.default_rng(0)
+        audio = AudioBuffer(0.1 * rng.standard_normal(int(segments * seconds * SAMPLE_RATE)).astype(np.float32))
+    windows = [(i * seconds, (i + 1) * seconds) for i in range(segments) if (i + 1) * seconds <= audio.duration]
+    return [fe(audio.slice(st, ed), sampling_rate=SAMPLE_RATE, return_tensors="pt").input_features for st, ed in windows]
+
+
+def run(model, inputs, max_new_tokens, draft=None) -> tuple[list[torch.Tensor], float, int]:
+    outputs, tokens = [], 0
+    t0 = time.perf_counter()
+    with torch.no_grad():
+        for inp in inputs:
+            kwargs = {"assistant_model": draft, "do_sample": False} if draft is not None else {}
+            ids = model.generate(inp, max_new_tokens=max_new_tokens, **kwargs)[0]
+            outputs.append(ids)
+            tokens += len(ids)
+    return outputs, time.perf_counter() - t0, tokens
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default=os.getenv("WHISPER_MODEL_PATH"))
+    parser.add_argument("--draft", default=os.getenv("WHISPER_DRAFT_MODEL_PATH"))
+    parser.add_argument("--build-tiny", help="собрать маленькие чекпойнты в этой папке и мерить на них")
+    parser.add_argument("--audio", help="запись; без неё — шум")
+    parser.add_argument("--segments", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=20.0, help="длина сегмента, с")
+    parser.add_argument("--max-new-tokens", type=int, default=128)
+    args = parser.parse_args()
+
+    if args.build_tiny:
+        args.model, args.draft = build_tiny(args.build_tiny)
+    if not args.model or not args.draft:
+        parser.error("нужны --model и --draft (или --build-tiny)")
+
+    model = WhisperForConditionalGeneration.from_pretrained(args.model).eval()
+    draft = WhisperForConditionalGeneration.from_pretrained(args.draft).eval()
+    inputs = features(args.model, args.audio, args.segments, args.seconds)
+    print(f"Сегментов: {len(inputs)} по {args.seconds} с")
+
+    run(model, inputs[:1], 8)  # прогрев
+    greedy, t_greedy, n_greedy = run(model, inputs, args.max_new_tokens)
+    assisted, t_assisted, n_assisted = run(model, inputs, args.max_new_tokens, draft)
+
+    identical = all(torch.equal(a, b) for a, b in zip(greedy, assisted))
+    print(f"Без черновика: {n_greedy / t_greedy:.1f} ток/с ({t_greedy:.2f} с)")
+    print(f"С черновиком:  {n_assisted / t_assisted:.1f} ток/с ({t_assisted:.2f} с), "
+          f"ускорение x{t_greedy / t_assisted:.2f}")
+    print(f"Вывод совпадает с жадным декодированием: {'да' if identical else 'НЕТ'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Сравнение признаков Whisper: processor(...) на каждый сегмент
+против кадров спектрограммы всего файла по отсчётам окна (LogMelSpectrogram).
+
+    python -m scripts.bench_features --hours 2 --segments 2000
+    python -m scripts.bench_features --audio path/to/file.wav
+"""
+import argparse
+import time
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from app.services.audio_service import SAMPLE_RATE, AudioBuffer
+from app.services.whisper_service import LogMelSpectrogram, segment_features
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--audio", help="аудиофайл; без него генерируется шум со звуком")
+parser.add_argument("--hours", type=float, default=1.0)
+parser.add_argument("--segments", type=int, default=1000)
+parser.add_argument("--batch", type=int, default=8)
+args = parser.parse_args()
+
+rng = np.random.default_rng(0)
+if args.audio:
+    audio = AudioBuffer.from_file(args.audio)
+else:
+    n = int(args.hours * 3600 * SAMPLE_RATE)
+    t = np.arange(n, dtype=np.float32) / SAMPLE_RATE
+    audio = AudioBuffer(0.3 * np.sin(2 * np.pi * 220 * t) + 0.05 * rng.standard_normal(n).astype(np.float32))
+
+# случайные сегменты 0.5–20 с, как после диаризации
+starts = np.sort(rng.uniform(0, max(audio.duration - 20, 0), args.segments))
+windows = [(float(st), float(st + rng.uniform(0.5, 20))) for st in starts]
+print(f"Аудио: {audio.duration / 3600:.2f} ч, сегментов: {len(windows)}")
+
+t0 = time.perf_counter()
+for b in range(0, len(windows), args.batch):
+    segment_features(audio, windows[b:b + args.batch])
+per_segment = time.perf_counter() - t0
+print(f"processor(...) по сегментам: {per_segment:.2f} с")
+
+t0 = time.perf_counter()
+spec = LogMelSpectrogram(audio)
+for b in range(0, len(windows), args.batch):
+    segment_features(audio, windows[b:b + args.batch], spec)
+global_total = time.perf_counter() - t0
+print(f"LogMelSpectrogram по окнам: {global_total:.2f} с (ускорение x{per_segment / global_total:.1f})")
+
+# расхождение внутри сегментов (крайние кадры отличаются из-за соседнего звука)
+diff = 0.0
+for st, ed in windows[:50]:
+    ref = segment_features(audio, [(st, ed)])[0]
+    mine = segment_features(audio, [(st, ed)], spec)[0]
+    n = min(int((ed - st) * 100), ref.shape[1]) - 2
+    if n > 2:
+        diff = max(diff, float((ref[:, 2:n] - mine[:, 2:n]).abs().max()))
+print(f"Макс. расхождение признаков внутри сегментов: {diff:.4f}")
@@ -0,0 +1,122 @@
+"""
+Сравнение бэкендов Whisper (WHISPER_BACKEND) на эталонном наборе:
+коэффициент реального времени, пиковая память процесса и расхождение WER
+с fp32 torch (и с эталонным текстом, если он есть).
+
+Набор — JSONL, по строке на запись: {"audio": "path.wav", "text": "эталон"}
+(поле text необязательно).
+
+    python -m scripts.compare_backends --manifest reference.jsonl
+    python -m scripts.compare_backends --manifest reference.jsonl --backends torch,torch-int8
+"""
+import argparse
+import json
+import multiprocessing as mp
+import os
+import resource
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def _run_backend(backend, manifest):
+    # бэкенд выбирается при импорте whisper_service, поэтому каждый — в своём процессе
+    os.environ["WHISPER_BACKEND"] = backend
+    from app.core.tuning import apply_tuning
+    from app.services.audio_service import AudioBuffer
+    from app.services.vad_service import speech_windows
+    from app.services import whisper_service
+
+    apply_tuning()
+    rss_model = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    hypotheses, audio_seconds, wall = [], 0.0, 0.0
+    for i, item in enumerate(manifest):
+        audio = AudioBuffer.from_file(item["audio"])
+        windows = speech_windows(audio) or [(0.0, audio.duration)]
+        if i == 0:
+            whisper_service.transcribe_segments(audio, windows[:1])  # прогрев
+        t0 = time.perf_counter()
+        texts = whisper_service.transcribe_segments(audio, windows)
+        wall += time.perf_counter() - t0
+        audio_seconds += audio.duration
+        hypotheses.append(" ".join(t for t in texts if t))
+    return {
+        "backend": backend,
+        "rtf": round(wall / audio_seconds, 4),  # секунд работы на секунду аудио, меньше — лучше
+        "model_rss_mb": round(rss_model / 1024),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024),
+        "hypotheses": hypotheses,
+    }
+
+
+def word_errors(reference: str, hypothesis: str) -> tuple[int, int]:
+    """Расстояние Левенштейна по словам и длина эталона."""
+    ref, hyp = reference.lower().split(), hypothesis.lower().split()
+    row = list(range(len(hyp) + 1))
+    for i, r in enumerate(ref, 1):
+        prev, row[0] = row[0], i
+        for j, h in enumerate(hyp, 1):
+            prev, row[j] = row[j], min(row[j] + 1, row[j - 1] + 1, prev + (r != h))
+    return row[-1], len(ref)
+
+
+def wer(references: list[str], hypotheses: list[str]) -> float:
+    errors = words = 0
+    for ref, hyp in zip(references, hypotheses):
+        e, n = word_errors(ref, hyp)
+        errors += e
+        words += n
+    return round(errors / max(words, 1), 4)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--manifest", required=True, help="JSONL: {\"audio\": путь, \"text\": эталон}")
+    parser.add_argument("--backends", default="torch,torch-int8,onnx")
+    parser.add_argument("--output", help="куда записать отчёт JSON")
+    args = parser.parse_args()
+
+    with open(args.manifest, encoding="utf-8") as f:
+        manifest = [json.loads(line) for line in f if line.strip()]
+    backends = args.backends.split(",")
+    if "torch" not in backends:
+        backends.insert(0, "torch")  # базовая линия для дрейфа WER
+
+    ctx = mp.get_context("spawn")
+    runs = {}
+    for backend in backends:
+        print(f"{backend}...", flush=True)
+        # новый процесс на каждый бэкенд: чистая память и свой импорт модели
+        with ProcessPoolExecutor(1, mp_context=ctx) as pool:
+            try:
+                runs[backend] = pool.submit(_run_backend, backend, manifest).result()
+            except Exception as e:
+                print(f"  {backend}: {type(e).__name__}: {e}, пропускаем")
+
+    # без базовой линии дрейф не считается, остальные метрики остаются
+    baseline = runs["torch"]["hypotheses"] if "torch" in runs else None
+    if baseline is None:
+        print("  torch не отработал: дрейф WER не считается")
+    references = [item.get("text") for item in manifest]
+    report = []
+    for backend, run in runs.items():
+        row = {k: v for k, v in run.items() if k != "hypotheses"}
+        if baseline is not None:
+            row["wer_drift_vs_torch"] = wer(baseline, run["hypotheses"])
+        if all(references):
+            row["wer"] = wer(references, run["hypotheses"])
+        report.append(row)
+        print(f"  {backend}: RTF {row['rtf']}, память {row['model_rss_mb']}/{row['peak_rss_mb']} МБ"
+              + (f", дрейф WER {row['wer_drift_vs_torch']}" if "wer_drift_vs_torch" in row else "")
+              + (f", WER {row['wer']}" if "wer" in row else ""))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
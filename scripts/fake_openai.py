@@ -0,0 +1,103 @@
+"""
+Локальный OpenAI-совместимый сервер для проверки полировки без сети и квоты:
+/v1/chat/completions возвращает текст сегмента из промпта (в кавычках) как есть,
+а в JSON-режиме — строки «N [говорящий]: текст» объектом {"N": "текст"},
+/v1/embeddings — детерминированные псевдослучайные векторы. Задержка и доля
+ответов 429/500 настраиваются, чтобы проверять лимитер и повторы.
+
+    python -m scripts.fake_openai --port 8089 --latency 0.3 --error-rate 0.1
+    OPENAI_BASE_URL=http://127.0.0.1:8089/v1 OPENAI_API_KEY=test uvicorn app.main:app
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import re
+import time
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+app = FastAPI()
+config = {"latency": 0.0, "error_rate": 0.0, "dim": 1536}
+stats = {"chat": 0, "embeddings": 0, "errors": 0}
+
+
+async def _simulate():
+    """Задержка и случайная ошибка; None, если запрос обслуживается."""
+    await asyncio.sleep(config["latency"])
+    if random.random() < config["error_rate"]:
+        stats["errors"] += 1
+        status = random.choice((429, 500))
+        return JSONResponse(
+            status_code=status,
+            content={"error": {"message": "fake error", "type": "fake", "code": status}},
+            headers={"retry-after": "0.1"} if status == 429 else None,
+        )
+
+
+def _usage(prompt: str, completion: str) -> dict:
+    p, c = len(prompt) // 3 + 1, len(completion) // 3 + 1
+    return {"prompt_tokens": p, "completion_tokens": c, "total_tokens": p + c}
+
+
+@app.post("/v1/chat/completions")
+async def chat(request: Request):
+    body = await request.json()
+    if error := await _simulate():
+        return error
+    stats["chat"] += 1
+    prompt = body["messages"][-1]["content"]
+    if (body.get("response_format") or {}).get("type") == "json_object":
+        answer = json.dumps(dict(re.findall(r"^(\d+) \[[^\]]*\]: (.*)$", prompt, re.M)), ensure_ascii=False)
+    else:
+        quoted = re.findall(r'"([^"]*)"', prompt)
+        answer = quoted[-1] if quoted else prompt.rsplit(":", 1)[-1].strip()
+    return {
+        "id": f"chatcmpl-{stats['chat']}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "fake"),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": answer}, "finish_reason": "stop"}],
+        "usage": _usage(prompt, answer),
+    }
+
+
+@app.post("/v1/embeddings")
+async def embeddings(request: Request):
+    body = await request.json()
+    if error := await _simulate():
+        return error
+    stats["embeddings"] += 1
+    texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+    data = []
+    for i, text in enumerate(texts):
+        seed = int.from_bytes(hashlib.sha1(text.encode()).digest()[:4], "little")
+        vec = np.random.default_rng(seed).standard_normal(config["dim"]).astype(np.float32)
+        data.append({"object": "embedding", "index": i, "embedding": (vec / np.linalg.norm(vec)).tolist()})
+    return {"object": "list", "data": data, "model": body.get("model", "fake"),
+            "usage": {"prompt_tokens": sum(len(t) // 3 + 1 for t in texts), "total_tokens": 0}}
+
+
+@app.get("/stats")
+async def get_stats():
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка ответа, с")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="доля ответов 429/500")
+    parser.add_argument("--dim", type=int, default=1536, help="размерность эмбеддингов")
+    args = parser.parse_args()
+    config.update(latency=args.latency, error_rate=args.error_rate, dim=args.dim)
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
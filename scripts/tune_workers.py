@@ -0,0 +1,168 @@
+"""
+Подбор числа процессов инференса и потоков torch на этой машине.
+
+Для каждой конфигурации «процессы × потоки» (не больше числа ядер) запускает
+процессы, привязанные к своим ядрам, прогоняет через whisper_service
+одинаковые запросы и меряет пропускную способность и задержку. Лучшая
+конфигурация пишется в INFERENCE_TUNING_PATH и применяется сервисом при старте.
+
+    python -m scripts.tune_workers --audio sample.wav --requests 16
+    python -m scripts.tune_workers --duration 60 --mode full --workers 1,2,4
+"""
+import argparse
+import json
+import multiprocessing as mp
+import os
+import queue
+import sys
+import time
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from app.core.tuning import INFERENCE_TUNING_PATH
+
+
+def _bench_worker(cores, threads, audio_path, duration, mode, tasks, results):
+    os.sched_setaffinity(0, cores)
+    import torch
+    torch.set_num_threads(threads)
+
+    from app.services.audio_service import SAMPLE_RATE, AudioBuffer
+    from app.services import whisper_service
+
+    if audio_path:
+        audio = AudioBuffer.from_file(audio_path)
+    else:
+        # синтетический «голос»: тон с амплитудной модуляцией и шум
+        t = np.arange(int(duration * SAMPLE_RATE), dtype=np.float32) / SAMPLE_RATE
+        audio = AudioBuffer(0.3 * np.sin(2 * np.pi * 180 * t) * (1 + np.sin(2 * np.pi * 3 * t))
+                            + 0.02 * np.random.default_rng(0).standard_normal(len(t)).astype(np.float32))
+    # окна как после диаризации: реплики по 2–12 с
+    rng = np.random.default_rng(1)
+    windows, st = [], 0.0
+    while st < audio.duration - 1:
+        ed = min(st + rng.uniform(2, 12), audio.duration)
+        windows.append((st, ed))
+        st = ed + 0.3
+
+    def run():
+        if mode == "full":
+            whisper_service.transcribe_full(audio)
+        else:
+            whisper_service.transcribe_segments(audio, windows)
+
+    run()  # прогрев
+    results.put(("ready", audio.duration))
+    while tasks.get() is not None:
+        t0 = time.perf_counter()
+        run()
+        results.put(("done", time.perf_counter() - t0))
+
+
+def _core_sets(cores: list[int], workers: int, threads: int) -> list[list[int]]:
+    return [cores[i * threads:(i + 1) * threads] for i in range(workers)]
+
+
+def _result(results, procs):
+    """Следующий ответ процессов; RuntimeError, если процесс упал (например, не хватило памяти)."""
+    while True:
+        try:
+            return results.get(timeout=1)
+        except queue.Empty:
+            dead = [p for p in procs if p.exitcode not in (None, 0)]
+            if dead:
+                for p in procs:
+                    p.terminate()
+                raise RuntimeError(f"процесс завершился с кодом {dead[0].exitcode}")
+
+
+def measure(workers, threads, cores, args) -> dict:
+    ctx = mp.get_context("spawn")
+    tasks, results = ctx.Queue(), ctx.Queue()
+    affinity = _core_sets(cores, workers, threads)
+    procs = [ctx.Process(target=_bench_worker,
+                         args=(affinity[i], threads, args.audio, args.duration, args.mode, tasks, results))
+             for i in range(workers)]
+    for p in procs:
+        p.start()
+    # все процессы загрузили модель и прогрелись
+    audio_seconds = max(_result(results, procs)[1] for _ in procs)
+
+    t0 = time.perf_counter()
+    for _ in range(args.requests):
+        tasks.put(1)
+    latencies = [_result(results, procs)[1] for _ in range(args.requests)]
+    wall = time.perf_counter() - t0
+    for _ in procs:
+        tasks.put(None)
+    for p in procs:
+        p.join()
+
+    latencies.sort()
+    return {
+        "cpu_workers": workers,
+        "torch_threads": threads,
+        "affinity": affinity,
+        "throughput_rtf": round(audio_seconds * args.requests / wall, 2),  # секунд аудио в секунду
+        "latency_p50": round(latencies[len(latencies) // 2], 2),
+        "latency_p95": round(latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)], 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--audio", help="пример записи; без него — синтетический клип")
+    parser.add_argument("--duration", type=float, default=30.0, help="длина синтетического клипа, с")
+    parser.add_argument("--mode", choices=["segments", "full"], default="segments")
+    parser.add_argument("--workers", default="1,2,4,8", help="числа процессов через запятую")
+    parser.add_argument("--threads", default="auto",
+                        help="потоков torch через запятую; auto — все ядра поровну между процессами")
+    parser.add_argument("--requests", type=int, default=8, help="запросов на конфигурацию")
+    parser.add_argument("--output", default=INFERENCE_TUNING_PATH)
+    args = parser.parse_args()
+
+    cores = sorted(os.sched_getaffinity(0))
+    runs = []
+    configs = []
+    for workers in [int(w) for w in args.workers.split(",")]:
+        if args.threads == "auto":
+            configs.append((workers, len(cores) // workers))
+        else:
+            configs += [(workers, int(t)) for t in args.threads.split(",")]
+
+    for workers, threads in configs:
+        if not threads or workers * threads > len(cores):
+            continue
+        print(f"{workers} процесс(ов) × {threads} поток(ов)...", flush=True)
+        try:
+            runs.append(measure(workers, threads, cores, args))
+        except RuntimeError as e:
+            print(f"  не удалось: {e}, пропускаем")
+            continue
+        r = runs[-1]
+        print(f"  пропускная способность x{r['throughput_rtf']} реального времени, "
+              f"p50 {r['latency_p50']} с, p95 {r['latency_p95']} с")
+
+    if not runs:
+        sys.exit(f"Ни одна конфигурация не измерена: все не помещаются в {len(cores)} ядер "
+                 "или упали; рекомендация не записана")
+
+    # максимум пропускной способности, при равенстве — меньшая p95
+    best = max(runs, key=lambda r: (r["throughput_rtf"], -r["latency_p95"]))
+    recommendation = {
+        "cpu_executor": "process" if best["cpu_workers"] > 1 else "thread",
+        "cpu_workers": best["cpu_workers"],
+        "torch_threads": best["torch_threads"],
+        "affinity": best["affinity"],
+        "measured": runs,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(recommendation, f, indent=2)
+    print(f"Рекомендация: {best['cpu_workers']} × {best['torch_threads']}, записано в {args.output}")
+
+
+if __name__ == "__main__":
+    main()